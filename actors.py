@@ -15,7 +15,7 @@ class Actor(Entity):
 
     def __init__(self, w, h):
         Entity.__init__(self, w, h)
-        self.categories.update(["actor"])
+        self.add_categories("actor")
         self.has_gravity = True
         self.is_grounded = False
         self.is_left_walled = False
@@ -96,7 +96,7 @@ class Player(Actor):
         self.full_height = 48
         self.crouch_height = 32
         Actor.__init__(self, 16, self.full_height)
-        self.categories.update(["player"])
+        self.add_categories("player")
         self.speed = 4
         self.crouch_speed = 1.25
         self.max_slide_speed = 1
@@ -109,6 +109,7 @@ class Player(Actor):
         self.active_bullet = None  # rect where bullet is
 
         self.interact_radius = 32
+        self.interact_max_dist = 96  # no interactable touching the interact box is farther (level doors are 64x96)
         self.is_crouching = False
 
         self.post_dmg_invincibility_max_cooldown = 45
@@ -236,12 +237,11 @@ class Player(Actor):
 
         if self._has_control_of_character():
             box = self.get_rect().inflate((self.interact_radius, 0))
-            interactables = world.get_entities_in_rect(box, category="interactable")
-            cntr = self.center()
-            if len(interactables) > 0:
-                interactables.sort(key=lambda x: cool_math.dist(cntr, x.center()))
+            nearest = world.get_nearest_entity(self.center(), self.interact_max_dist, category="interactable",
+                                               cond=lambda e: box.colliderect(e.get_rect()))
+            if nearest is not None:
                 if keyboard_interact:
-                    interactables[0].interact(world)
+                    nearest.interact(world)
                 else:
                     # TODO - plop down "press k" Overlay
                     pass
@@ -306,6 +306,7 @@ class Player(Actor):
                         hit_entity.deal_damage(1, source=self, direction=direction)
                     elif hit_entity.is_wall():
                         hit_entity.bullet_hit()
+                        world.wake(hit_entity)
 
                 sounds.play(sounds.ENERGY_PULSE)
 
@@ -321,24 +322,20 @@ class Player(Actor):
         bullet_h = 4
         self.active_bullet = pygame.Rect(bullet_x, bullet_y, bullet_w, bullet_h)
 
-        hitbox = self.active_bullet.inflate(0, 4)
-        hitting_hurtbox = lambda x: hitbox.colliderect(x.get_hurtbox())
-        colliders = world.get_entities_in_rect(hitbox, category="enemy", cond=hitting_hurtbox)
-        colliders.extend(world.get_entities_in_rect(self.active_bullet, category="wall"))
+        direction = (1, 0) if self.facing_right else (-1, 0)
+        origin = (rect.x + rect.width if self.facing_right else rect.x, bullet_y + bullet_h / 2)
+        hurtbox_rect = lambda x: pygame.Rect(x.get_hurtbox()).inflate(0, 4)
+        hit = world.raycast(origin, direction, bullet_w, category="enemy", rect_of=hurtbox_rect, thickness=bullet_h)
 
         hit_entity = None
-        if len(colliders) > 0:
+        if hit is not None:
+            hit_entity = hit.entity
+            bullet_w = int(hit.dist)
             if self.facing_right:
-                colliders.sort(key=lambda x: x.get_x())
-                hit_entity = colliders[0]
-                bullet_w = hit_entity.get_x() - bullet_x
                 splash = Overlay(images.BULLET_SPLASH).with_lifespan(cycles=1)
                 splash.set_x(bullet_x + bullet_w - splash.width())
             else:
-                colliders.sort(key=lambda x: x.get_x() + x.width())
-                hit_entity = colliders[-1]
-                bullet_w = self.get_x() - (hit_entity.get_x() + hit_entity.width())
-                bullet_x = hit_entity.get_x() + hit_entity.width()
+                bullet_x = origin[0] - bullet_w
                 splash = Overlay(images.BULLET_SPLASH, modifier="flipped").with_lifespan(cycles=1)
                 splash.set_x(bullet_x)
 
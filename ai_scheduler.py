@@ -0,0 +1,34 @@
+"""
+Spreads enemies' expensive decision making ("thinking") out over ticks. Each enemy thinks once every
+think_interval ticks, with their turns staggered so they don't all land on the same tick, and no more
+than a fixed number of them think in any one tick. Cheap per-tick stuff (moving, colliding) isn't
+affected.
+"""
+
+
+class AIScheduler:
+
+    def __init__(self, max_thinks_per_tick):
+        self.max_thinks_per_tick = max_thinks_per_tick
+        self._next_phase = 0        # hands out staggered first turns, round-robin
+        self._thinks_this_tick = 0
+
+    def start_tick(self):
+        self._thinks_this_tick = 0
+
+    def should_think(self, agent, tick):
+        """
+        agent: something with think_interval and next_think_tick fields (next_think_tick starts as None).
+        returns: whether agent should think this tick. If it's agent's turn but the tick's budget is used up,
+            it gets to go next tick instead.
+        """
+        if agent.next_think_tick is None:
+            agent.next_think_tick = tick + self._next_phase % agent.think_interval
+            self._next_phase += 1
+
+        if tick < agent.next_think_tick or self._thinks_this_tick >= self.max_thinks_per_tick:
+            return False
+
+        self._thinks_this_tick += 1
+        agent.next_think_tick = tick + agent.think_interval
+        return True
@@ -0,0 +1,225 @@
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")  # doesn't need a real window
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+
+import actors
+import enemies
+import entity_factory
+import global_state
+import huds
+import inputs
+import levels
+import spatial
+import world
+
+
+class ChunkVisitCounter:
+    """Counts how many chunks the world's spatial queries look at."""
+
+    def __init__(self, the_world):
+        self.queries = 0
+        self.visits = 0
+        self.visits_with_above_and_left = 0  # what the queries would cost if they still scanned up and left
+
+        original = the_world.get_chunks_in_rect
+
+        def counting_get_chunks_in_rect(rect, and_above_and_left=False):
+            res = original(rect, and_above_and_left=and_above_and_left)
+            if not and_above_and_left:  # drawing and updating still use the extra chunks, on purpose
+                self.queries += 1
+                self.visits += len(res)
+                self.visits_with_above_and_left += len(original(rect, and_above_and_left=True))
+            return res
+
+        original_iter = the_world.iter_chunks_in_rect
+
+        def counting_iter_chunks_in_rect(rect):
+            self.queries += 1
+            self.visits_with_above_and_left += len(original(rect, and_above_and_left=True))
+            for chunk in original_iter(rect):
+                self.visits += 1
+                yield chunk
+
+        the_world.get_chunks_in_rect = counting_get_chunks_in_rect
+        the_world.iter_chunks_in_rect = counting_iter_chunks_in_rect
+
+    def report(self, name):
+        q = max(1, self.queries)
+        print("{}\t{} queries, {:.2f} chunks/query (would be {:.2f} scanning up and left)".format(
+            name, self.queries, self.visits / q, self.visits_with_above_and_left / q))
+
+
+def build_world(level_id, spatial_index=None, memoize_queries=False):
+    the_world = world.World(spatial_index=spatial_index, memoize_queries=memoize_queries)
+    level = levels.get_level(level_id)
+    level.build(the_world)
+    the_world.update_all_wall_outlines(None)
+    player = actors.Player()
+    player.set_xy(*level.get_player_start_pos())
+    the_world.add_entity(player)
+    return the_world
+
+
+def run_ticks(the_world, n_ticks, walk_dir=inputs.RIGHT):
+    """Runs the world with the player walking in one direction. returns: seconds per tick"""
+    input_state = inputs.InputState()
+    start = time.time()
+    for i in range(0, n_ticks):
+        global_state.tick_counter += 1
+        input_state.update()
+        input_state.set_key(walk_dir[0], True)
+        if i % 40 == 0:
+            input_state.set_key(inputs.JUMP[0], i % 80 == 0)
+        the_world.update_all(input_state)
+    return (time.time() - start) / n_ticks
+
+
+def random_query_rects(the_world, n, seed=12345):
+    """returns: list of rects around the level, sized like the queries the game makes (points, tiles, actors, lights)"""
+    rng = random.Random(seed)
+    keys = list(the_world.chunks.keys())
+    res = []
+    for _ in range(0, n):
+        key = rng.choice(keys)
+        size = rng.choice([1, 16, 32, 48, 512])
+        res.append(pygame.Rect(key[0] + rng.randint(0, world.CHUNK_SIZE), key[1] + rng.randint(0, world.CHUNK_SIZE),
+                               size, size))
+    return res
+
+
+def bench_spatial_indexes(level_id, n_ticks=600, n_queries=20000):
+    for index_type in spatial.ALL_TYPES:
+        the_world = build_world(level_id, spatial_index=index_type)
+        secs_per_tick = run_ticks(the_world, n_ticks)
+
+        rects = random_query_rects(the_world, n_queries)
+        start = time.time()
+        found = 0
+        for rect in rects:
+            found += len(the_world.get_entities_in_rect(rect, category="solid"))
+        secs_per_query = (time.time() - start) / n_queries
+
+        print("{}\t{:<16}{:.3f} ms/tick, {:.2f} us/query ({} found)".format(
+            level_id, index_type, secs_per_tick * 1000, secs_per_query * 1000000, found))
+
+
+def bench_early_exit(level_id, n_queries=20000):
+    """'is there anything here?' asked three ways: building the full list, with a limit, and with any_in_rect"""
+    the_world = build_world(level_id)
+    rects = random_query_rects(the_world, n_queries)
+    ways = [("full list", lambda r: len(the_world.get_entities_in_rect(r, category="solid")) > 0),
+            ("limit=1", lambda r: len(the_world.get_entities_in_rect(r, category="solid", limit=1)) > 0),
+            ("any_in_rect", lambda r: the_world.any_in_rect(r, category="solid"))]
+    for name, query in ways:
+        start = time.time()
+        found = 0
+        for rect in rects:
+            found += 1 if query(rect) else 0
+        secs_per_query = (time.time() - start) / n_queries
+        print("{}	{:<16}{:.2f} us/query ({} hits)".format(level_id, name, secs_per_query * 1000000, found))
+
+
+def bench_hitscan(level_id, n_shots=20000, length=464):
+    """finding the first wall in front of a bullet: querying its whole rect and sorting, vs raycasting"""
+    the_world = build_world(level_id)
+    rng = random.Random(12345)
+    shots = [(rect.x, rect.y, rng.choice([1, -1])) for rect in random_query_rects(the_world, n_shots)]
+
+    def with_rect_query(x, y, dx):
+        rect = pygame.Rect(x if dx > 0 else x - length, y - 2, length, 4)
+        walls = the_world.get_entities_in_rect(rect, category="wall")
+        walls.sort(key=lambda w: w.get_x() * dx)
+        return walls[0] if len(walls) > 0 else None
+
+    def with_raycast(x, y, dx):
+        hit = the_world.raycast((x, y), (dx, 0), length, thickness=4)
+        return hit.entity if hit is not None else None
+
+    for name, shoot in [("rect query", with_rect_query), ("raycast", with_raycast)]:
+        start = time.time()
+        hits = 0
+        for shot in shots:
+            hits += 1 if shoot(*shot) is not None else 0
+        secs_per_shot = (time.time() - start) / n_shots
+        print("{}\t{:<16}{:.2f} us/shot ({} hits)".format(level_id, name, secs_per_shot * 1000000, hits))
+
+
+def add_crowd(the_world, n_enemies, seed=12345):
+    """scatters n_enemies zombies around the world's chunks"""
+    rng = random.Random(seed)
+    keys = list(the_world.chunks.keys())
+    for _ in range(0, n_enemies):
+        key = rng.choice(keys)
+        enemy = enemies.Zombie()
+        enemy.set_xy(key[0] + rng.randint(0, world.CHUNK_SIZE), key[1] + rng.randint(0, world.CHUNK_SIZE))
+        the_world.add_entity(enemy)
+
+
+def bench_query_memoization(level_id, n_ticks=600, crowd_sizes=(0, 300)):
+    for n_enemies in crowd_sizes:
+        for memoize in (False, True):
+            the_world = build_world(level_id, memoize_queries=memoize)
+            add_crowd(the_world, n_enemies)
+            secs_per_tick = run_ticks(the_world, n_ticks)
+            stats = the_world._spatial.get_stats_string() if memoize else "off"
+            print("{}\t{} enemies, memoized queries: {:.3f} ms/tick, {}".format(
+                level_id, n_enemies, secs_per_tick * 1000, stats))
+
+
+def bench_chunk_visits(level_id, n_ticks=600):
+    the_world = build_world(level_id, spatial_index=spatial.CHUNK_GRID)
+    counter = ChunkVisitCounter(the_world)
+    secs_per_tick = run_ticks(the_world, n_ticks)
+    counter.report(level_id)
+    print("{}\t{:.3f} ms/tick".format(level_id, secs_per_tick * 1000))
+
+
+def bench_tile_memory(factory_ids=("ground_stone", "white_wall"), ground_id="ground_stone", n_tiles=10000):
+    """python memory taken up by a grid of n_tiles static tiles (not counting pygame surfaces, like wall outlines)"""
+    for factory_id in factory_ids:
+        tracemalloc.start()
+        start = tracemalloc.get_traced_memory()[0]
+        tiles = []
+        for i in range(0, n_tiles):
+            tile = entity_factory.build(factory_id)
+            tile.set_xy(1000 + (i % 100) * 32, 1000 + (i // 100) * 32)
+            tiles.append(tile)
+        used = tracemalloc.get_traced_memory()[0] - start
+        tracemalloc.stop()
+        print("{:<16}{:.1f} KB per {} tiles ({} bytes each)".format(factory_id, used / 1024, n_tiles, used // n_tiles))
+
+    # ground doesn't go into the world as entities though, just into its chunks' tile layers
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    the_world = world.World()
+    for i in range(0, n_tiles):
+        the_world.set_tile(1000 + (i % 100) * 32, 1000 + (i // 100) * 32, ground_id, invalidate=False)
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    print("{:<16}{:.1f} KB per {} tiles ({} bytes each)".format("tile layer", used / 1024, n_tiles, used // n_tiles))
+
+
+def init():
+    pygame.init()
+    pygame.display.set_mode((global_state.WIDTH, global_state.HEIGHT))
+    global_state.hud = huds.HUD()
+
+
+if __name__ == "__main__":
+    # usage: python benchmarks.py [level_id ...]
+    init()
+    level_ids = sys.argv[1:] if len(sys.argv) > 1 else levels.LEVEL_SEQ
+    bench_tile_memory()
+    for level_id in level_ids:
+        bench_chunk_visits(level_id)
+        bench_spatial_indexes(level_id)
+        bench_early_exit(level_id)
+        bench_hitscan(level_id)
+        bench_query_memoization(level_id)
@@ -10,6 +10,8 @@ import huds
 import inputs
 import cool_math
 import levels
+import level_journal
+import loading
 import sounds
 import actors
 import menus
@@ -38,6 +40,10 @@ class Hate:
         self.input_state = inputs.InputState()
         self.active_world = world.World()
         self.active_world.add_entity(actors.Player())
+        self.loading_job = None
+        self.preloader = loading.Preloader()
+        self.level_snapshot = None  # used to restart the current level quickly
+        self.level_snapshot_version = 0  # version of the level journal when the snapshot was taken
 
         gs.hud = huds.HUD()
         gs.hud.set_active_menu(menus.MAIN_MENU)
@@ -48,6 +54,7 @@ class Hate:
         self.set_custom_command(pygame.K_F2, lambda: pygame.image.save(self.screen, "screenshots/screenshot.png"), "take screenshot")
         self.set_custom_command(pygame.K_F4, self.toggle_fullscreen, "toggle fullscreen")
         self.set_custom_command(pygame.K_F5, self.save_level, "save level")
+        self.set_custom_command(pygame.K_F6, self.rewrite_level, "rewrite level file from world")
 
     def set_custom_command(self, key, command, name):
         self._custom_key_commands[key] = (name, command)
@@ -59,7 +66,9 @@ class Hate:
         s = self.screen
         screen_rect = (0, 0, gs.WIDTH, gs.HEIGHT)
         pygame.draw.rect(s, settings.BLACK, screen_rect, 0)
-        self.active_world.draw_all(s)
+        if self.loading_job is None:
+            # the loading thread may be drawing chunk layers, and the title card covers everything anyways
+            self.active_world.draw_all(s)
         gs.hud.draw(s, offset=cool_math.neg(self.active_world.get_camera()))
         gs.draw_counter += 1
 
@@ -72,22 +81,15 @@ class Hate:
             self.active_world.update_all(self.input_state)
 
         if gs.queued_next_level_name is not None:
-            level = levels.get_level(gs.queued_next_level_name)
-            gs.level_save_dest = gs.queued_next_level_name
-            pygame.display.set_caption("HATE (editing " + gs.queued_next_level_name + ".txt)")
+            self.start_loading_level(gs.queued_next_level_name)
             gs.queued_next_level_name = None
 
-            player = actors.Player()
-            pos = level.get_player_start_pos()
-            player.set_xy(pos[0], pos[1])
+        if self.loading_job is not None:
+            gs.hud.set_level_loading_progress(self.loading_job.get_progress())
+            if self.loading_job.is_done():
+                self._swap_in_world(self.loading_job)
 
-            self.active_world = world.World()  # start anew
-            level.build(self.active_world)
-            self.active_world.add_entity(player)
-
-            image_cache.wipe_caches()
-
-            self.active_world.update_all_wall_outlines(self.input_state)
+        self.preloader.update()
 
         player_dead = self.active_world.time_since_player_death() > settings.WAIT_TICKS_AFTER_DEATH
         if player_dead and not gs.hud.is_absorbing_inputs():
@@ -98,11 +100,81 @@ class Hate:
         if gs.exit_requested:
             self.stop_running()
 
+    def start_loading_level(self, level_id):
+        if self.loading_job is not None:
+            print("WARN\tabandoning level that's still loading: ", self.loading_job.level_id)
+
+        level = levels.get_level(level_id)
+        gs.level_save_dest = level_id
+        pygame.display.set_caption("HATE (editing " + level_id + ".txt)")
+        level.show_title_card()
+
+        journal = gs.level_journal
+        if level_id == levels.LEVEL_VOID:
+            journal = None
+        elif journal is None or journal.path != settings.CONFIGS["level_dir"] + level_id:
+            journal = level_journal.LevelJournal(settings.CONFIGS["level_dir"] + level_id,
+                                                 compact_after=settings.JOURNAL_COMPACT_AFTER)
+        gs.level_journal = journal
+
+        if journal is not None and journal.version != self.level_snapshot_version:
+            self.level_snapshot = None  # the level was edited since it was taken
+
+        if self.level_snapshot is not None and self.level_snapshot.level_id == level_id:
+            print("INFO\trestarting level from snapshot: ", level_id)
+            self.active_world = self.level_snapshot.restore(self.active_world)
+            self.loading_job = None
+            gs.hud.set_level_loading_progress(None)
+            return
+
+        self.loading_job = self.preloader.take(level_id)
+        if self.loading_job is None:
+            self.loading_job = loading.LoadingJob(level_id).start()
+        gs.hud.set_level_loading_progress(self.loading_job.get_progress())
+
+    def _swap_in_world(self, job):
+        self.active_world.close()
+        self.active_world = job.get_world()
+        self.level_snapshot = job.get_snapshot()
+        if gs.level_journal is not None:
+            self.level_snapshot_version = gs.level_journal.version
+        self.loading_job = None
+
+        image_cache.wipe_caches()
+        baked_layers = job.get_baked_layers()
+        for key in baked_layers:
+            image_cache.put_cached_image(key, baked_layers[key])
+
+        gs.hud.set_level_loading_progress(None)
+
+        if settings.PRELOAD_NEXT_LEVELS:
+            self.preloader.preload(self._get_next_level_ids(job.get_level()))
+
+    def _get_next_level_ids(self, level):
+        res = list(level.next_levels())
+        for door in self.active_world.get_entities_with(category="level_door"):
+            if door.dest_level_id not in res and door.dest_level_id != level.get_id():
+                res.append(door.dest_level_id)
+        return res
+
     def save_level(self):
+        if gs.level_journal is not None:
+            print("INFO\tsaving level edits to: ", gs.level_journal.path)
+            gs.level_journal.compact()
+        else:
+            print("ERROR\tgs.level_journal is None! Not saving.")
+
+    def rewrite_level(self):
+        """Saves every entity in the world to the level file, instead of just the journaled edits."""
         filename = gs.level_save_dest
         if filename is not None:
-            print("INFO\tsaving world to: ", filename)
+            if gs.level_journal is not None:
+                gs.level_journal.wait()
+            print("INFO\trewriting level file from world: ", filename)
             levels.save_to_level_file(self.active_world, filename)
+            if gs.level_journal is not None:
+                gs.level_journal.reset()  # its file was just discarded
+            self.level_snapshot = None  # it's out of date now
         else:
             print("ERROR\tgs.level_save_dest is None! Not saving.")
 
@@ -194,17 +194,13 @@ def corner_snap_rects(to_move, target, outside=True):
 
 
 def closest_rect_by_center(pt, rects):
-    rects = list(rects)
     best_dist = None
     best_r = None
     for r in rects:
-        if best_r is None:
+        cur_dist = dist(pt, (r[0] + r[2]/2, r[1] + r[3]/2))
+        if best_r is None or cur_dist < best_dist:
             best_r = r
-            best_dist = dist(pt, (r[0] + r[2]/2, r[1] + r[3]/2))
-        else:
-            cur_dist = dist(pt, (r[0] + r[2]/2, r[1] + r[3]/2))
-            if cur_dist < best_dist:
-                best_r = r
+            best_dist = cur_dist
     return best_r
 
 
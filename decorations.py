@@ -4,12 +4,13 @@ import images
 
 class Decoration(entities.Entity):
     """Just a noninteractive piece of art basically."""
+    __slots__ = ("animation", "dec_id")
 
     def __init__(self, dec_id, animation):
         entities.Entity.__init__(self, animation.width(), animation.height())
         self.animation = animation
         self.dec_id = dec_id
-        self.categories.update(["decoration"])
+        self.add_categories("decoration")
 
     def get_dec_id(self):
         return self.dec_id
@@ -21,9 +22,11 @@ class Decoration(entities.Entity):
         return (0, 0)
 
 
-class Ground(Decoration):
+class Ground(entities.StaticTile, Decoration):
+    """Only used by the editor, to place ground. Worlds keep their ground in tile layers (see tile_layer.py)."""
+    __slots__ = ()
 
     def __init__(self, dec_id, animation):
         Decoration.__init__(self, dec_id, animation)
-        self.categories.update(["ground"])
+        self.add_categories("ground")
 
@@ -8,16 +8,20 @@ import cool_math
 import global_state
 import images
 import entities
+import settings
+import wall_contours
 
 
 class Enemy(actors.Actor):
     def __init__(self, w, h):
         actors.Actor.__init__(self, w, h)
-        self.categories.update(["enemy"])
+        self.add_categories("enemy")
         self.speed = 0.75 + random.random()/2
         self.current_dir = [0, 0]
         self.max_health = 4  # four hearts
         self.health = 4
+        self.think_interval = settings.AI_THINK_INTERVAL
+        self.next_think_tick = None  # set by the world's AI scheduler
 
     def sprite(self):
         return None
@@ -114,7 +118,7 @@ class DumbEnemy(Enemy):
             self._reverse_countdown = 20
 
         if self._reverse_countdown <= 0:
-            if len(world.get_entities_in_rect(self.get_rect(), category="reverse", limit=1)) > 0:
+            if world.any_in_rect(self.get_rect(), category="reverse"):
                 self.set_direction(-dir_x, 0)
                 self._reverse_countdown = 20
         else:
@@ -122,7 +126,7 @@ class DumbEnemy(Enemy):
 
 
 class SmartEnemy(Enemy):
-    """chases player"""
+    """chases player, once it's seen them"""
 
     def __init__(self, w, h):
         Enemy.__init__(self, w, h)
@@ -133,10 +137,15 @@ class SmartEnemy(Enemy):
         self.forget_time = 240
 
     def do_ai_behavior(self, input_state, world):
+        # the velocity keeps being applied every tick, only the decisions are spread out
+        if world.should_think(self):
+            self.think(world)
+
+    def think(self, world):
         p = world.player()
         if p is not None:
             dist = cool_math.dist(self.center(), p.center())
-            if dist <= self.radius:
+            if dist <= self.radius and world.has_line_of_sight(self.center(), p.center()):
                 self.start_chasing()  # it's ok to call this every frame
             elif dist > self.forget_radius:
                 follow_time = global_state.tick_counter - self.start_chasing_time
@@ -152,13 +161,15 @@ class SmartEnemy(Enemy):
         p = world.player()
         if p is None:
             return
-        direction = cool_math.sub(p.center(), self.center())
-        direction = cool_math.normalize(direction)
+        direction = world.get_direction_to_player(self.center())
+        if direction is None:
+            direction = cool_math.sub(p.center(), self.center())
+            direction = cool_math.normalize(direction)
         self.set_direction(direction[0], direction[1])
 
     def do_non_chase_behavior(self, world):
-        # change directions approx every 30 ticks
-        if random.random() < 1 / 60:
+        # change directions approx every 60 ticks
+        if random.random() < self.think_interval / 60:
             if random.random() < 0.25:
                 self.set_direction(0, 0)
             else:
@@ -312,7 +323,7 @@ class SpikyEnemy(Enemy):
     def _update_status_tags(self, world, input_state):
         Enemy._update_status_tags(self, world, input_state)
         up_sliver = cool_math.sliver_adjacent(self.get_rect(), (0, -1), 2)
-        self.is_top_walled = len(world.get_entities_in_rect(up_sliver, category="wall", limit=1)) > 0
+        self.is_top_walled = world.any_in_rect(up_sliver, category="wall")
 
     def do_ai_behavior(self, input_state, world):
         if self._reverse_countdown > 0:
@@ -330,7 +341,7 @@ class SpikyEnemy(Enemy):
                 y_dir = -y_dir
                 did_reverse = True
 
-            if not did_reverse and len(world.get_entities_in_rect(self.get_rect(), category="reverse", limit=1)) > 0:
+            if not did_reverse and world.any_in_rect(self.get_rect(), category="reverse"):
                 x_dir = -x_dir  # ideally one of these directions would be zero
                 y_dir = -y_dir
                 did_reverse = True
@@ -416,7 +427,7 @@ class StickyEnemy(Enemy):
     def _update_status_tags(self, world, input_state):
         Enemy._update_status_tags(self, world, input_state)
         up_sliver = cool_math.sliver_adjacent(self.get_rect(), (0, -1), 2)
-        self.is_top_walled = len(world.get_entities_in_rect(up_sliver, category="wall", limit=1)) > 0
+        self.is_top_walled = world.any_in_rect(up_sliver, category="wall")
 
     def update(self, input_state, world):
         actors.Actor.update(self, input_state, world)
@@ -437,29 +448,70 @@ class StickyEnemy(Enemy):
 
             if not (post_left or post_right or post_down or post_up):
                 # gotta wrap now
-                rect = self.get_rect()
-                search_rect = rect.inflate(self.speed + 4, self.speed + 4)
-                walls_nearby = world.get_entities_in_rect(search_rect, category="wall")
-                if len(walls_nearby) > 0:
-                    rects_nearby = list(map(lambda x: x.get_rect(), walls_nearby))
-                    snaps = map(lambda x: cool_math.corner_snap_rects(rect, x, outside=True), rects_nearby)
-                    my_center = self.center()
-                    best_snap = cool_math.closest_rect_by_center(my_center, snaps)
-
-                    # snap onto surface, and update direction
-                    self.set_xy(best_snap[0], best_snap[1])
-                    cd = self.current_dir
-                    if cd[0] == -1:
-                        self.set_direction(0, -1 if self.clockwise else 1)
-                    elif cd[0] == 1:
-                        self.set_direction(0, 1 if self.clockwise else -1)
-                    elif cd[1] == -1:
-                        self.set_direction(1 if self.clockwise else -1, 0)
-                    elif cd[1] == 1:
-                        self.set_direction(-1 if self.clockwise else 1, 0)
-
-                    self.set_x(self.get_x() + self.current_dir[0] * 4)  # move a bit onto the next edge
-                    self.set_y(self.get_y() + self.current_dir[1] * 4)
+                if not self._wrap_around_contour(world):
+                    self._wrap_around_nearest_wall(world)
+
+    def _wall_dir(self):
+        """returns: direction from this crawler to the wall it's on (or was on, if it just ran off the end)."""
+        cd = self.current_dir
+        return (-cd[1], cd[0]) if self.clockwise else (cd[1], -cd[0])
+
+    def _wrap_around_contour(self, world):
+        """
+        Follows the wall contour graph onto the next surface.
+        returns: False if it couldn't, because the wall it was on doesn't fully cover the tile it ran off of.
+        """
+        cd = self.current_dir
+        if cd[0] == 0 and cd[1] == 0:
+            return False
+        wall_dir = self._wall_dir()
+        contours = world.get_wall_contours()
+        ts = contours.tile_size
+
+        # the tile it just ran off of is behind it, on the wall side
+        ctr = self.center()
+        half_w, half_h = self.width() / 2, self.height() / 2
+        probe_x = ctr[0] - cd[0] * (half_w + 2) + wall_dir[0] * (half_w + 2)
+        probe_y = ctr[1] - cd[1] * (half_h + 2) + wall_dir[1] * (half_h + 2)
+        edge = (int(probe_x // ts), int(probe_y // ts), (-wall_dir[0], -wall_dir[1]))
+
+        next_edge = contours.next_edge(edge, self.clockwise)
+        if next_edge is None:
+            return False
+
+        # hang just off the start of the next edge, a bit onto it, like snapping corners used to
+        side = next_edge[2]
+        new_dir = wall_contours.travel_dir(side, self.clockwise)
+        start = contours.edge_start(next_edge, self.clockwise)
+        self.set_center(start[0] + side[0] * half_w + new_dir[0] * (4 - half_w),
+                        start[1] + side[1] * half_h + new_dir[1] * (4 - half_h))
+        self.set_direction(new_dir[0], new_dir[1])
+        return True
+
+    def _wrap_around_nearest_wall(self, world):
+        rect = self.get_rect()
+        search_rect = rect.inflate(self.speed + 4, self.speed + 4)
+        walls_nearby = world.get_entities_in_rect(search_rect, category="wall")
+        if len(walls_nearby) > 0:
+            rects_nearby = list(map(lambda x: x.get_rect(), walls_nearby))
+            snaps = map(lambda x: cool_math.corner_snap_rects(rect, x, outside=True), rects_nearby)
+            my_center = self.center()
+            best_snap = cool_math.closest_rect_by_center(my_center, snaps)
+
+            # snap onto surface, and update direction
+            self.set_xy(best_snap[0], best_snap[1])
+            cd = self.current_dir
+            if cd[0] == -1:
+                self.set_direction(0, -1 if self.clockwise else 1)
+            elif cd[0] == 1:
+                self.set_direction(0, 1 if self.clockwise else -1)
+            elif cd[1] == -1:
+                self.set_direction(1 if self.clockwise else -1, 0)
+            elif cd[1] == 1:
+                self.set_direction(-1 if self.clockwise else 1, 0)
+
+            self.set_x(self.get_x() + self.current_dir[0] * 4)  # move a bit onto the next edge
+            self.set_y(self.get_y() + self.current_dir[1] * 4)
 
     def do_ai_behavior(self, input_state, world):
         up = self.is_top_walled
@@ -9,16 +9,32 @@ import puzzles
 import settings
 
 
+_CATEGORY_SETS = {}     # frozenset -> the one copy of it that entities share
+
+
+def category_set(categories):
+    """returns: a frozenset of categories, shared with every other entity that has the same ones."""
+    categories = frozenset(categories)
+    return _CATEGORY_SETS.setdefault(categories, categories)
+
+
 class Entity:
+    # Levels are mostly static tiles. Wall, Decoration and Ground declare slots for everything they set, so they
+    # never get a __dict__. Every other entity (actors, doors...) still makes one in its __init__, as usual.
+    # Things that are rarely set live on the class until they are.
+    __slots__ = ("is_alive", "_x", "_y", "rect", "categories", "factory_id",
+                 "__dict__", "__weakref__")
+
+    vel = (0, 0)        # only things that move (see actors.Actor) have one of their own
+    light_radius = None
+    ref_id = None       # used by the level loader to mark entity as 'special'
+
     def __init__(self, w, h):
         self.is_alive = True
         self._x = 0.0  # floating point, 'true' x position of entity
         self._y = 0.0  # floating point, 'true' y position of entity
         self.rect = pygame.Rect(0, 0, w, h)
-        self.vel = [0, 0]
-        self.categories = set()
-        self.light_radius = None
-        self.ref_id = None      # used by the level loader to mark entity as 'special'
+        self.categories = category_set(())  # shared and frozen, see add_categories
         self.factory_id = None  # used by the level loaded to mark entity as factory created
 
     def draw(self, screen, offset=(0, 0), modifier=None):
@@ -33,9 +49,15 @@ class Entity:
 
     def with_category(self, category):
         validate_category(category)
-        self.categories.add(category)
+        self.add_categories(category)
         return self
 
+    def add_categories(self, *categories):
+        self.categories = category_set(self.categories.union(categories))
+
+    def remove_categories(self, *categories):
+        self.categories = category_set(self.categories.difference(categories))
+
     def set_factory_id(self, factory_id):
         self.factory_id = factory_id
 
@@ -55,6 +77,17 @@ class Entity:
     def update(self, input_state, world):
         pass
 
+    def needs_update(self):
+        """
+        Whether update should be called next tick. Entities that say no are skipped until something
+        wakes them back up (see World.wake).
+        """
+        return type(self).update is not Entity.update
+
+    def get_triggers(self):
+        """returns: the trigger volumes (see triggers.py) this entity brings into the world with it."""
+        return ()
+
     def get_rect(self):
         """
         The space that this entity physically occupies. Note that this rect is uncopied.
@@ -175,9 +208,9 @@ class Entity:
         """
         self.light_radius = radius
         if radius is not None:
-            self.categories.add("light_source")
-        elif "light_source" in self.categories:
-            self.categories.remove("light_source")
+            self.add_categories("light_source")
+        else:
+            self.remove_categories("light_source")
 
         return self
 
@@ -200,13 +233,43 @@ class Entity:
         return type(self).__name__ + pos
 
 
-class Wall(Entity):
+class StaticTile:
+    """
+    Mixin for the tiles that levels are mostly made of. They never move once they're placed, so their rect is
+    all there is to their position, and everything else they have (sprite, categories, factory id, outline)
+    is shared with the other tiles of their kind.
+    """
+    __slots__ = ()
+
+    @property
+    def _x(self):
+        return self.rect.x
+
+    @_x.setter
+    def _x(self, x):
+        pass  # set_x puts it in the rect
+
+    @property
+    def _y(self):
+        return self.rect.y
+
+    @_y.setter
+    def _y(self, y):
+        pass
+
+
+_SHARED_OUTLINES = {}   # (w, h, rects of the outline) -> Surface, shared by every wall whose outline looks like that
+
+
+class Wall(StaticTile, Entity):
+    __slots__ = ("_sprite", "_cached_outline", "_outline_dirty")
+
     def __init__(self, w=32, h=32, sprite=images.WHITE_WALL):
         Entity.__init__(self, w, h)
         self._sprite = sprite
         self._cached_outline = None  # surface
         self._outline_dirty = True
-        self.categories.update(["wall", "solid"])
+        self.add_categories("wall", "solid")
 
     def bullet_hit(self):
         pass
@@ -220,6 +283,9 @@ class Wall(Entity):
     def set_outline_dirty(self, is_dirty):
         self._outline_dirty = is_dirty
 
+    def needs_update(self):
+        return self._outline_dirty
+
     def draw(self, screen, offset=(0, 0), modifier=None):
         Entity.draw(self, screen, offset, modifier)
         if self._cached_outline is not None:
@@ -231,13 +297,9 @@ class Wall(Entity):
             self._outline_dirty = False
 
             for chunk in world.get_chunks_in_rect(self.get_rect(), and_above_and_left=False):
-                chunk.mark_dirty()  # ehh this is kinda gross
+                chunk.mark_dirty(self.get_rect())  # ehh this is kinda gross
 
     def update_outlines(self, world):
-        if self._cached_outline is None:
-            self._cached_outline = pygame.Surface(self.size(), flags=pygame.SRCALPHA)
-        else:
-            self._cached_outline.fill((0, 0, 0, 0), None)
         rect = self.get_rect()
         rect_bigger = rect.inflate(2, 2)
 
@@ -245,7 +307,6 @@ class Wall(Entity):
         color = settings.BLACK
 
         relevent_walls = world.get_entities_in_rect(rect_bigger, category="wall")
-        relevent_ground = world.get_entities_in_rect(rect_bigger, category="ground")
 
         def any_in_pt(ents, pt):
             for e in ents:
@@ -253,6 +314,14 @@ class Wall(Entity):
                     return True
             return False
 
+        def any_ground_at_pt(pt):
+            # like any_in_pt, points on the right or bottom edge of a tile count as being in it
+            for x in {pt[0], pt[0] - 1}:
+                for y in {pt[1], pt[1] - 1}:
+                    if world.get_tile(x, y) is not None:
+                        return True
+            return False
+
         border_length = int((rect[2] * 2 + (rect[3] - 1)  * 2) / thickness) + 1
 
         def get_border_pos(r, i):
@@ -280,16 +349,26 @@ class Wall(Entity):
                 yield (r[0] + int(r[2]/2) + d[0]*r[2], r[1] + int(r[3]/2) + d[1]*r[3])
 
         border_r = [0, 0, thickness, thickness]
+        outline_rects = []
 
         for j in range(0, border_length):
             get_border_pos(border_r, j)
             for n in neighbors(border_r):
-                if any_in_pt(relevent_ground, n) and not any_in_pt(relevent_walls, n):
-                    border_r[0] -= rect.x
-                    border_r[1] -= rect.y
-                    pygame.draw.rect(self._cached_outline, color, border_r, 0)
+                if any_ground_at_pt(n) and not any_in_pt(relevent_walls, n):
+                    outline_rects.append((border_r[0] - rect.x, border_r[1] - rect.y, thickness, thickness))
                     break
 
+        if len(outline_rects) == 0:
+            self._cached_outline = None
+            return
+        key = (rect.width, rect.height, tuple(outline_rects))
+        if key not in _SHARED_OUTLINES:
+            outline = pygame.Surface(self.size(), flags=pygame.SRCALPHA)
+            for r in outline_rects:
+                pygame.draw.rect(outline, color, r, 0)
+            _SHARED_OUTLINES[key] = outline
+        self._cached_outline = _SHARED_OUTLINES[key]
+
 
 class BreakableWall(Wall):
     def __init__(self, sprite, break_animation=None):
@@ -300,6 +379,9 @@ class BreakableWall(Wall):
     def bullet_hit(self):
         self._was_hit = True
 
+    def needs_update(self):
+        return Wall.needs_update(self) or self._was_hit
+
     def update(self, input_state, world):
         Wall.update(self, input_state, world)
         if self._was_hit:
@@ -318,19 +400,31 @@ class Door(Entity):
         self.door_id = door_id
         self.dest_id = dest_id
         self.locked = locked
-        self.categories.update(["door", "interactable"])
-
-        # Cooldown behavior:
-        #   0: door is closed. 
-        #   1: player is teleported to reciever door.
-        #   >1: door is opening.
-        #   <0: door is closing
-        self.open_cooldown = 0
+        self.add_categories("door", "interactable")
+
         self.open_max_cooldown = 30
+        self._open_timer = None   # runs while the door is opening or closing
+        self._is_opening = False
+
+    def get_open_cooldown(self):
+        """
+        Cooldown behavior:
+            0: door is closed.
+            1: player is teleported to reciever door.
+            >1: door is opening.
+            <0: door is closing
+        """
+        if self._open_timer is None or not self._open_timer.is_active():
+            return 0
+        elif self._is_opening:
+            return self._open_timer.remaining() + 1
+        else:
+            return -self._open_timer.remaining()
 
     def sprite(self):
-        if self.open_cooldown != 0 and abs(self.open_cooldown) < self.open_max_cooldown:
-            cd = self.open_cooldown if self.open_cooldown > 0 else self.open_max_cooldown + self.open_cooldown
+        open_cooldown = self.get_open_cooldown()
+        if open_cooldown != 0 and abs(open_cooldown) < self.open_max_cooldown:
+            cd = open_cooldown if open_cooldown > 0 else self.open_max_cooldown + open_cooldown
             progress = cd / self.open_max_cooldown
             animation = images.DOOR_CLOSING
             frame = int(progress * animation.num_frames())
@@ -341,26 +435,25 @@ class Door(Entity):
             else:
                 return images.DOOR_UNLOCKED
 
-    def update(self, input_state, world):
-        if self.open_cooldown == 1:
-            player = world.player()
-            dest_door = world.get_door(self.dest_id)
-            if player is not None and dest_door is not None:
-                player.set_center(*dest_door.center())
-                dest_door.open_cooldown = -dest_door.open_max_cooldown
+    def _finished_opening(self, world):
+        player = world.player()
+        dest_door = world.get_door(self.dest_id)
+        if player is not None and dest_door is not None:
+            player.set_center(*dest_door.center())
+            dest_door._start_closing(world)
 
-        if self.open_cooldown > 0:
-            self.open_cooldown -= 1
-        if self.open_cooldown < 0:
-            self.open_cooldown += 1
+    def _start_closing(self, world):
+        self._is_opening = False
+        self._open_timer = world.schedule(self.open_max_cooldown)
 
     def can_interact(self):
         # can't interact after it's already been interacted with
-        return self.open_cooldown == 0
+        return self.get_open_cooldown() == 0
 
     def interact(self, world):
         if not self.locked:
-            self.open_cooldown = self.open_max_cooldown
+            self._is_opening = True
+            self._open_timer = world.schedule(self.open_max_cooldown - 1, self._finished_opening)
         else:
             global_state.hud.display_text("It's locked.")
 
@@ -371,7 +464,7 @@ class Door(Entity):
 class Terminal(Entity):
     def __init__(self, message=None, text_color=settings.GREEN):
         Entity.__init__(self, 32, 64)
-        self.categories.update(["terminal"])
+        self.add_categories("terminal")
         self.zone = None
         self.message = None
         self.text_color = text_color
@@ -385,9 +478,8 @@ class Terminal(Entity):
         Entity.set_y(self, y)
         self.zone.set_center_y(self.center()[1])
 
-    def update(self, input_state, world):
-        if self.zone is not None:
-            self.zone.update(input_state, world)
+    def get_triggers(self):
+        return (self.zone,)
 
     def sprite(self):
         return images.TERMINAL
@@ -416,12 +508,9 @@ class Terminal(Entity):
         :param message: string or list of strings
         """
         self.message = message
-        if self.message is not None:
-            if self.zone is None:
-                self.zone = MessageZone(message, self.width() + 64, self.height(), one_time=False, color=self.text_color)
-            self.zone.set_message(message)
-        else:
-            self.zone = None
+        if self.zone is None:
+            self.zone = MessageZone(message, self.width() + 64, self.height(), one_time=False, color=self.text_color)
+        self.zone.set_message(message)
 
     def interact(self, world):
         pass
@@ -433,7 +522,7 @@ class Terminal(Entity):
 class PuzzleTerminal(Terminal):
     def __init__(self, puzzle_giver):
         Terminal.__init__(self, "Press [K] to activate puzzle", text_color=settings.WHITE)
-        self.categories.update(["puzzle_terminal", "interactable"])
+        self.add_categories("puzzle_terminal", "interactable")
         self.active_callback = None
         self.on_success = None  # no-arg lambda
         self.puzzle_creator = puzzle_giver
@@ -449,6 +538,9 @@ class PuzzleTerminal(Terminal):
             self._handle_result(self.active_callback[0], world)
             self.active_callback = None
 
+    def needs_update(self):
+        return self.active_callback is not None
+
     def _handle_result(self, puzzle_result, world):
         pass
 
@@ -467,6 +559,7 @@ class PuzzleTerminal(Terminal):
         else:
             puzzle = self.puzzle_creator()
             self.active_callback = global_state.hud.set_puzzle(puzzle)
+            world.wake(self)
 
     def is_complete(self):
         return self.has_been_completed
@@ -495,7 +588,7 @@ class DeathPuzzleTerminal(PuzzleTerminal):
 class HealthMachine(Entity):
     def __init__(self, num_hearts=3):
         Entity.__init__(self, 32, 64)
-        self.categories.update(["interactable", "health_machine"])
+        self.add_categories("interactable", "health_machine")
         self.hearts_left = max(0, min(4, num_hearts))  # gotta be between zero and four hearts
 
     def sprite(self):
@@ -533,19 +626,20 @@ class HealthMachine(Entity):
 class LevelEndDoor(Entity):
     def __init__(self, dest_level_id):
         Entity.__init__(self, 64, 96)
-        self.categories.update(["interactable", "level_door"])
+        self.add_categories("interactable", "level_door")
         self.dest_level_id = dest_level_id
         self.is_locked = True
         self.is_open = False
         self.max_opening_cooldown = 60
-        self.opening_cooldown = -1
+        self._opening_timer = None
 
-    def update(self, input_state, world):
-        if not self.is_locked and self.opening_cooldown > 0:
-            self.opening_cooldown -= 1
-        if not self.is_locked and self.opening_cooldown <= 0:
-            self.is_open = True
-            # TODO - play sound
+    def get_opening_cooldown(self):
+        """returns: ticks until the door is open, or -1 if it hasn't been unlocked."""
+        return -1 if self._opening_timer is None else self._opening_timer.remaining()
+
+    def _finished_opening(self, world):
+        self.is_open = True
+        # TODO - play sound
 
     def draw(self, screen, offset=(0, 0), modifier="normal"):
         x = self.get_x() + offset[0]
@@ -553,15 +647,16 @@ class LevelEndDoor(Entity):
         bot_sprite = images.BLAST_DOOR_BOTTOM
         top_y_closed = self.get_y() + offset[1]
         bot_y_closed = self.get_y() + offset[1] + self.height() - top_sprite.height()
-        if self.is_locked or self.opening_cooldown == self.max_opening_cooldown:
+        opening_cooldown = self.get_opening_cooldown()
+        if self.is_locked or opening_cooldown == self.max_opening_cooldown:
             images.draw_animated_sprite(screen, (x, top_y_closed), top_sprite, modifier=modifier)
             images.draw_animated_sprite(screen, (x, bot_y_closed), bot_sprite, modifier=modifier)
-        elif self.is_open or self.opening_cooldown <= 0:
+        elif self.is_open or opening_cooldown <= 0:
             images.draw_animated_sprite(screen, self.get_rect().move(offset[0], offset[1]), images.BLAST_DOOR_BKGR)
         else:
             # door is opening
             images.draw_animated_sprite(screen, self.get_rect().move(offset[0], offset[1]), images.BLAST_DOOR_BKGR)
-            progress = 1 - self.opening_cooldown / self.max_opening_cooldown
+            progress = 1 - opening_cooldown / self.max_opening_cooldown
             top_cut_off = int(progress * top_sprite.height())
             bot_cut_off = int(progress * bot_sprite.height())
             top_subset = [0, top_cut_off, top_sprite.width(), top_sprite.height() - top_cut_off]
@@ -590,7 +685,7 @@ class LevelEndDoor(Entity):
                 global_state.hud.display_text(msg)
             else:
                 self.is_locked = False
-                self.opening_cooldown = self.max_opening_cooldown
+                self._opening_timer = world.schedule(self.max_opening_cooldown, self._finished_opening)
                 # TODO - play sound
         else:
             # door is opening
@@ -607,11 +702,12 @@ class Overlay(Entity):
     def __init__(self, animation, modifier="normal"):
         Entity.__init__(self, animation.width(), animation.height())
         self._modifier = modifier
-        self.categories.update(["overlay"])
+        self.add_categories("overlay")
         self.animation = animation
         self._tick_limit = -1
         self._create_time = global_state.tick_counter
         self._target = None
+        self._expiry_timer = None
 
     def sprite_modifier(self):
         return self._modifier
@@ -635,10 +731,17 @@ class Overlay(Entity):
         self._target = target
         return self
 
+    def _lifetime(self):
+        if self._expiry_timer is not None:
+            # on the world's clock, same as the expiry, so a paused world doesn't play extra frames
+            return self._tick_limit - self._expiry_timer.remaining()
+        elif self._tick_limit >= 0:
+            return 0  # hasn't been updated yet
+        else:
+            return global_state.tick_counter - self._create_time
+
     def sprite(self):
-        current_tick = global_state.tick_counter
-        spawn_tick = self._create_time
-        lifetime = current_tick - spawn_tick
+        lifetime = self._lifetime()
         tpf = self.animation.ticks_per_frame()
         cur_frame = lifetime % (tpf * self.animation.num_frames())
         cur_frame = int(cur_frame / tpf)
@@ -648,30 +751,45 @@ class Overlay(Entity):
         if self._target is not None and not self._target.is_alive:
             self.is_alive = False
         elif self._tick_limit >= 0:
-            current_tick = global_state.tick_counter
-            spawn_tick = self._create_time
-            lifetime = current_tick - spawn_tick
-            if lifetime >= self._tick_limit:
-                self.is_alive = False
+            if self._expiry_timer is None:
+                self._expiry_timer = world.schedule(self._tick_limit, self._expire)
         elif self._target is not None:
             pos = self._target.center()
             self.set_center(pos[0], pos[1])
 
+    def needs_update(self):
+        # overlays that are just waiting to expire can sleep until their timer goes off
+        return self._target is not None or (self._tick_limit >= 0 and self._expiry_timer is None)
+
+    def _expire(self, world):
+        self.is_alive = False
+        world.wake(self)  # so it gets removed
+
 
 class KillBlock(Entity):
     def __init__(self, sprite, hitbox=None):
         Entity.__init__(self, sprite.width(), sprite.height())
         self._sprite = sprite
         self._hitbox = hitbox
-        self.categories.update(["instakill"])
+        self.add_categories("instakill")
 
     def sprite(self):
         return self._sprite
 
-    def update(self, input_state, world):
-        actors_touching = world.get_entities_in_rect(self.hitbox(), category="actor")
-        for actor in actors_touching:
-            actor.deal_damage(9999, source=self)  # TODO - 9999 is probably ok?
+    def get_triggers(self):
+        return (self,)
+
+    def get_trigger_rect(self):
+        return pygame.Rect(self.hitbox())
+
+    def actor_entered(self, actor, world):
+        actor.deal_damage(9999, source=self)  # TODO - 9999 is probably ok?
+
+    def actor_remains(self, actor, world):
+        actor.deal_damage(9999, source=self)
+
+    def actor_left(self, actor, world):
+        pass
 
     def hitbox(self):
         if self._hitbox is None:
@@ -688,7 +806,7 @@ class Platform(Entity):
     def __init__(self, width):
         w = int(round(width/16) * 16)
         Entity.__init__(self, w, 16)
-        self.categories.update(["platform", "solid"])
+        self.add_categories("platform", "solid")
 
     def draw(self, screen, offset=(0, 0), modifier=None):
         key = "platform_" + str(modifier) + str(self.width())
@@ -721,7 +839,7 @@ class Platform(Entity):
 class ReferenceEntity(Entity):
     def __init__(self, ref_id=None):
         Entity.__init__(self, 32, 32)
-        self.categories.update(["reference"])
+        self.add_categories("reference")
         self.set_ref_id(ref_id)
 
     def get_ref_id(self):
@@ -740,7 +858,7 @@ class SpawnerEntity(Entity):
     """
     def __init__(self, create_entity):
         Entity.__init__(self, 32, 32)
-        self.categories.update(["spawner"])
+        self.add_categories("spawner")
         self.create_entity = create_entity
         self.did_spawn = False
 
@@ -756,6 +874,9 @@ class SpawnerEntity(Entity):
             my_entity.set_ref_id("spawned_no_save_pls")
             world.add_entity(my_entity)
 
+    def needs_update(self):
+        return not self.did_spawn
+
     def draw(self, screen, offset=(0, 0), modifier=None):
         rect = self.get_rect().copy()
         rect.move_ip(offset[0], offset[1])
@@ -766,9 +887,8 @@ class Zone(Entity):
     """Invisible area that performs some effect when actors enter"""
     def __init__(self, w, h):
         Entity.__init__(self, w, h)
-        self.categories.update(["zone"])
+        self.add_categories("zone")
         self.debug_color = (125, 255, 125)
-        self.actors_inside = {}
 
     def sprite(self):
         return None
@@ -784,20 +904,11 @@ class Zone(Entity):
         dest = (self.get_x() + offset[0], self.get_y() + offset[1])
         screen.blit(cached_img, dest)
 
-    def update(self, input_state, world):
-        current_actors = set(world.get_entities_in_rect(self.get_rect(), category="actor"))
-        actors_last_frame = self.actors_inside
-
-        for actor in current_actors:
-            if actor not in actors_last_frame:
-                self.actor_entered(actor, world)
-            else:
-                self.actor_remains(actor, world)
-        for actor in actors_last_frame:
-            if actor not in current_actors:
-                self.actor_left(actor, world)
+    def get_triggers(self):
+        return (self,)
 
-        self.actors_inside = current_actors
+    def get_trigger_rect(self):
+        return self.get_rect()
 
     def actor_entered(self, actor, world):
         print("actor entered zone: ", actor)
@@ -821,7 +932,7 @@ class MessageZone(Zone):
         self.message = message
 
     def actor_entered(self, actor, world):
-        if self.one_time and self.has_shown:
+        if self.message is None or (self.one_time and self.has_shown):
             return
 
         if actor.is_player():
@@ -840,7 +951,7 @@ class Reverse(Entity):
     """
     def __init__(self):
         Entity.__init__(self, 16, 16)
-        self.categories.update(["reverse"])
+        self.add_categories("reverse")
 
     def draw(self, screen, offset=(0, 0), modifier=None):
         pygame.draw.rect(screen, (255, 128, 0), self.get_rect().move(offset[0], offset[1]), 2)
@@ -854,6 +965,20 @@ def _safe_remove(item, collection, print_err=False):
             print("cannot remove ", item, ", probably because it's not in the collection")
 
 
+def _accepts(entity, not_category, rect, cond):
+    if not_category is not None:
+        if isinstance(not_category, str):
+            if not_category in entity.categories:
+                return False
+        else:
+            for not_cat in not_category:
+                if not_cat in entity.categories:
+                    return False
+    if rect is not None and not entity.get_rect().colliderect(rect):
+        return False
+    return cond is None or cond(entity)
+
+
 class EntityCollection:
     VOLATILE_CATEGORIES = {"actor", "enemy", "player", "overlay"}
 
@@ -960,6 +1085,58 @@ class EntityCollection:
 
         return list(res_set)
 
+    def iter_all(self, category=None, not_category=None, rect=None, cond=None):
+        """
+            Like get_all, but yields the results one at a time as they're found, so callers that
+            only need the first few don't pay for the rest. Nothing is built up front.
+        """
+        if category is None:
+            to_test = self.all_stuff
+        elif isinstance(category, str):
+            if category not in self.categories:
+                return
+            to_test = self.categories[category]
+        else:
+            yield from self._iter_all_in_categories(category, not_category, rect, cond)
+            return
+
+        for e in to_test:
+            if _accepts(e, not_category, rect, cond):
+                yield e
+
+    def _iter_all_in_categories(self, categories, not_category, rect, cond):
+        seen = None  # entities can be in more than one of the categories
+        for cat in categories:
+            if cat not in self.categories:
+                continue
+            for e in self.categories[cat]:
+                if seen is not None and e in seen:
+                    continue
+                if _accepts(e, not_category, rect, cond):
+                    if seen is None:
+                        seen = set()
+                    seen.add(e)
+                    yield e
+
+    def any(self, category=None, not_category=None, rect=None, cond=None):
+        """returns: whether anything matches (see get_all), without building any lists."""
+        if category is None or isinstance(category, str):
+            if category is None:
+                to_test = self.all_stuff
+            elif category in self.categories:
+                to_test = self.categories[category]
+            else:
+                return False
+            for e in to_test:
+                if _accepts(e, not_category, rect, cond):
+                    return True
+            return False
+        else:
+            for cat in category:
+                if self.any(category=cat, not_category=not_category, rect=rect, cond=cond):
+                    return True
+            return False
+
     def all_categories(self):
         return self.categories.keys()
 
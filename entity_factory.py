@@ -2,6 +2,7 @@ import entities
 import decorations
 import images
 import enemies
+import tile_layer
 import tracks
 
 ALL_ENTITIES = {}  # id -> lambda: Entity
@@ -24,6 +25,11 @@ def build(factory_id):
         raise ValueError("unknown factory id: ", factory_id)
 
 
+def _ground(factory_id, animation):
+    tile_layer.register(factory_id, animation)
+    _put(factory_id, lambda: decorations.Ground(factory_id, animation))
+
+
 def _spawner(obj_builder):
     return lambda: entities.SpawnerEntity(obj_builder)
 
@@ -53,12 +59,12 @@ def init_entities():
     _put("lightbulb", lambda: decorations.Decoration("lightbulb", images.LIGHT_BULB).with_light_level(160))
     _put("wire_vert", lambda: decorations.Decoration("wire_vert", images.WIRE_VERTICAL))
     _put("chalkboard", lambda: decorations.Decoration("chalkboard", images.CHALKBOARD))
-    _put("ground_stone", lambda: decorations.Ground("ground_stone", images.STONE_GROUND))
-    _put("ground_sand", lambda: decorations.Ground("ground_sand", images.SAND_GROUND))
-    _put("ground_grass", lambda: decorations.Ground("ground_grass", images.GRASS_GROUND))
-    _put("ground_purple", lambda: decorations.Ground("ground_purple", images.PURPLE_GROUND))
-    _put("ground_wall", lambda: decorations.Ground("ground_wall", images.WALL_GROUND))
-    _put("ground_dark", lambda: decorations.Ground("ground_dark", images.DARK_GROUND))
+    _ground("ground_stone", images.STONE_GROUND)
+    _ground("ground_sand", images.SAND_GROUND)
+    _ground("ground_grass", images.GRASS_GROUND)
+    _ground("ground_purple", images.PURPLE_GROUND)
+    _ground("ground_wall", images.WALL_GROUND)
+    _ground("ground_dark", images.DARK_GROUND)
 
     _put("enemy_basic", _spawner(lambda: enemies.DumbEnemy()))
     _put("enemy_smart", _spawner(lambda: enemies.Zombie()))
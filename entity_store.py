@@ -0,0 +1,133 @@
+"""
+Integer handles for the entities in a world, and dense tables of per-entity data (components) looked up by them.
+
+A handle is a plain int that stays valid for as long as its entity is in the world. It can be kept around,
+put in sets, saved in tables etc. without keeping the entity alive, and once the entity's removed the handle
+goes stale (resolves to None) instead of pointing at whatever gets its slot next.
+
+A ComponentTable keeps one field of data for lots of entities in one packed array per field, one row per
+entity, so going through all of it touches a few arrays instead of an object per entity, and copying it is
+just copying the arrays.
+"""
+
+import array
+
+SLOT_BITS = 24  # low bits of a handle are its slot, the rest count how many times that slot's been reused
+SLOT_MASK = (1 << SLOT_BITS) - 1
+
+
+class EntityStore:
+
+    def __init__(self):
+        self._entities = []     # slot -> entity, or None if the slot's free
+        self._generations = array.array("L")    # slot -> times it's been reused
+        self._free_slots = []
+        self._handles = {}      # entity -> handle
+
+    def __len__(self):
+        return len(self._handles)
+
+    def __contains__(self, entity):
+        return entity in self._handles
+
+    def add(self, entity):
+        """returns: entity's handle. Adding an entity that's already here just returns its handle."""
+        handle = self._handles.get(entity)
+        if handle is not None:
+            return handle
+        if len(self._free_slots) > 0:
+            slot = self._free_slots.pop()
+            self._entities[slot] = entity
+        else:
+            slot = len(self._entities)
+            self._entities.append(entity)
+            self._generations.append(0)
+        handle = (self._generations[slot] << SLOT_BITS) | slot
+        self._handles[entity] = handle
+        return handle
+
+    def remove(self, entity):
+        handle = self._handles.pop(entity, None)
+        if handle is None:
+            return
+        slot = handle & SLOT_MASK
+        self._entities[slot] = None
+        self._generations[slot] += 1
+        self._free_slots.append(slot)
+
+    def get(self, handle):
+        """returns: the entity with this handle, or None if it's been removed."""
+        slot = handle & SLOT_MASK
+        if slot >= len(self._entities) or self._generations[slot] != handle >> SLOT_BITS:
+            return None
+        return self._entities[slot]
+
+    def handle_of(self, entity):
+        """returns: entity's handle, or None if it isn't here."""
+        return self._handles.get(entity)
+
+
+class ComponentTable:
+
+    def __init__(self, fields, typecode="d"):
+        """
+        fields: names of the table's columns.
+        typecode: what the columns hold (see the array module). Defaults to floats.
+        """
+        self.fields = tuple(fields)
+        self._columns = {field: array.array(typecode) for field in self.fields}
+        self._handles = array.array("Q")    # row -> handle
+        self._rows = {}                     # handle -> row
+
+    def __len__(self):
+        return len(self._handles)
+
+    def __contains__(self, handle):
+        return handle in self._rows
+
+    def add(self, handle, *values):
+        """values: one for each field, in order. Overwrites the handle's row if it already has one."""
+        row = self._rows.get(handle)
+        if row is None:
+            self._rows[handle] = len(self._handles)
+            self._handles.append(handle)
+            for field, value in zip(self.fields, values):
+                self._columns[field].append(value)
+        else:
+            for field, value in zip(self.fields, values):
+                self._columns[field][row] = value
+
+    def remove(self, handle):
+        """The last row's moved into the gap, so rows stay packed (and aren't stable, unlike handles)."""
+        row = self._rows.pop(handle, None)
+        if row is None:
+            return
+        last_handle = self._handles.pop()
+        if row < len(self._handles):
+            self._handles[row] = last_handle
+            self._rows[last_handle] = row
+        for column in self._columns.values():
+            last_value = column.pop()
+            if row < len(column):
+                column[row] = last_value
+
+    def get(self, handle, field):
+        return self._columns[field][self._rows[handle]]
+
+    def set(self, handle, field, value):
+        self._columns[field][self._rows[handle]] = value
+
+    def column(self, field):
+        """returns: the array holding field for every row, in the same order as handles(). Don't modify it."""
+        return self._columns[field]
+
+    def handles(self):
+        return self._handles
+
+    def copy(self):
+        res = ComponentTable(())
+        res.fields = self.fields
+        res._columns = {field: column[:] for field, column in self._columns.items()}
+        res._handles = self._handles[:]
+        res._rows = dict(self._rows)
+        return res
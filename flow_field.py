@@ -0,0 +1,108 @@
+"""
+A distance map toward the player over the wall tiles around them, shared by every chasing enemy. It's
+recomputed (a breadth-first search, a few hundred tiles per tick) only when the player moves to a
+different tile or walls change, and looking up which way to go from a point is O(1).
+"""
+
+import collections
+
+import cool_math
+
+_ORTHOGONAL = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+_ALL_DIRS = _ORTHOGONAL + [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+
+IDLE_TICKS = 60  # stops keeping the field up to date when nothing's asked it anything for this long
+
+
+class FlowField:
+
+    def __init__(self, tile_size, radius, tiles_per_tick):
+        """
+        radius: in tiles, how far around the player the field reaches.
+        tiles_per_tick: budget for the search, so a big field gets spread across a few ticks.
+        """
+        self.tile_size = tile_size
+        self.radius = radius
+        self.tiles_per_tick = tiles_per_tick
+
+        self._dist = {}         # tile -> steps to the goal, for the last finished search
+        self._goal = None       # the tile the search in progress (or the last finished one) is toward
+
+        self._pending = None    # tile -> steps, for the search in progress
+        self._frontier = collections.deque()
+        self._wall_version = None
+
+        self._last_asked = -IDLE_TICKS
+
+    def _tile_at(self, pt):
+        return (int(pt[0] // self.tile_size), int(pt[1] // self.tile_size))
+
+    def update(self, world):
+        if world.get_tick() - self._last_asked > IDLE_TICKS:
+            return
+        p = world.player()
+        if p is None:
+            return
+
+        goal = self._tile_at(p.center())
+        if goal != self._goal or world.get_wall_version() != self._wall_version:
+            self._start_search(world, goal)
+        if self._pending is not None:
+            self._continue_search(world)
+
+    def _start_search(self, world, goal):
+        self._goal = goal
+        self._wall_version = world.get_wall_version()
+        self._pending = {goal: 0}
+        self._frontier.clear()
+        self._frontier.append(goal)
+
+    def _continue_search(self, world):
+        gx, gy = self._goal
+        r = self.radius
+        pending = self._pending
+        frontier = self._frontier
+        for _ in range(0, self.tiles_per_tick):
+            if len(frontier) == 0:
+                # done, readers can switch over to it
+                self._dist = pending
+                self._pending = None
+                return
+            tile = frontier.popleft()
+            steps = pending[tile] + 1
+            for dx, dy in _ORTHOGONAL:
+                n = (tile[0] + dx, tile[1] + dy)
+                if n in pending or abs(n[0] - gx) > r or abs(n[1] - gy) > r:
+                    continue
+                if world.is_wall_tile(*n):
+                    continue
+                pending[n] = steps
+                frontier.append(n)
+
+    def get_direction(self, world, pt):
+        """
+        returns: unit vector from pt toward the next tile on the way to the player, or None if pt is outside
+            the field (or already in the player's tile), in which case heading straight at them is the best bet.
+        """
+        self._last_asked = world.get_tick()
+        tile = self._tile_at(pt)
+        dist = self._dist
+        best_steps = dist.get(tile)
+        if best_steps is None or best_steps == 0:
+            return None
+
+        best = None
+        for dx, dy in _ALL_DIRS:
+            n = (tile[0] + dx, tile[1] + dy)
+            steps = dist.get(n)
+            if steps is None or steps >= best_steps:
+                continue
+            if dx != 0 and dy != 0 and ((tile[0] + dx, tile[1]) not in dist or (tile[0], tile[1] + dy) not in dist):
+                continue  # don't cut corners
+            best_steps = steps
+            best = n
+
+        if best is None:
+            return None
+        target = ((best[0] + 0.5) * self.tile_size, (best[1] + 0.5) * self.tile_size)
+        return cool_math.normalize(cool_math.sub(target, pt))
@@ -24,6 +24,7 @@ is_fullscreen = False
 is_profiling = False
 
 level_save_dest = None          # TODO - move to LevelManager
+level_journal = None            # records the editor's changes to the current level
 queued_next_level_name = None
 
 show_enemy_health = False
@@ -14,6 +14,8 @@ import puzzles
 import menus
 import entity_factory
 import inputs
+import level_journal
+import tile_layer
 
 
 LEVEL_TITLE_SIZE = 128
@@ -43,9 +45,12 @@ class HUD:
         self.level_title_card = None  # (title, subtitle)
         self.level_title_card_countdown = -1
         self.level_title_card_max_countdown = 50
+        self.level_loading_progress = None  # float in [0, 1] while a level is loading in the background
 
         self.active_menu = None
 
+        self.world_being_edited = None  # while the mouse is dragging, all edits are batched into one transaction
+
     def set_active_menu(self, menu_id):
         print("INFO\tswitching to menu: ", menu_id)
         if menu_id is None:
@@ -81,10 +86,20 @@ class HUD:
         self.level_title_card = (level_name, level_subtitle)
         self.level_title_card_countdown = self.level_title_card_max_countdown
 
+    def set_level_loading_progress(self, progress):
+        """progress: float in [0, 1], or None if nothing is loading. The title card stays up while loading."""
+        self.level_loading_progress = progress
+
     def is_showing_title_card(self):
-        return self.level_title_card_countdown > 0 and self.level_title_card is not None
+        if self.level_title_card is None:
+            return False
+        return self.level_title_card_countdown > 0 or self.level_loading_progress is not None
 
     def update(self, input_state, world):
+        if self.world_being_edited is not None:
+            if self.world_being_edited is not world or not input_state.mouse_is_held():
+                self.world_being_edited.commit_edit()
+                self.world_being_edited = None
 
         if self.active_menu is not None:
             self.active_menu.update(input_state)
@@ -99,7 +114,8 @@ class HUD:
                 self._update_hotkey_items()
 
         if self.is_showing_title_card():
-            self.level_title_card_countdown -= 1
+            if self.level_title_card_countdown > 0:
+                self.level_title_card_countdown -= 1
 
         elif self.active_puzzle is not None:
             # if puzzle is active block everything else
@@ -227,6 +243,14 @@ class HUD:
             subtitle_y = title_y + title_h*len(title_lines) + 16
             screen.blit(subtitle_img, (border, subtitle_y))
 
+        if self.level_loading_progress is not None:
+            bar_h = 8
+            bar_y = global_state.HEIGHT - border - bar_h
+            bar_w = global_state.WIDTH - border*2
+            pygame.draw.rect(screen, white, [border, bar_y, bar_w, bar_h], 1)
+            fill_w = int(bar_w * max(0, min(1, self.level_loading_progress)))
+            pygame.draw.rect(screen, white, [border, bar_y, fill_w, bar_h], 0)
+
     def _draw_hearts(self, screen, pos, full, total):
         heart_w = images.HEART_FULL.width()
         for i in range(0, total):
@@ -326,17 +350,31 @@ class HUD:
             self.selected_item_placeable = False
         else:
             if to_place.is_ground():
-                blocked_by = world.get_entities_in_rect(to_place.get_rect(), category="ground")
+                blocked = world.get_tile(*to_place.xy()) is not None
             else:
-                blocked_by = world.get_entities_in_rect(to_place.get_rect(), not_category="ground")
-            self.selected_item_placeable = len(blocked_by) == 0
+                blocked = world.any_in_rect(to_place.get_rect())
+            self.selected_item_placeable = not blocked
+
+            # references need an id typed in for each one, so they can't be dragged
+            is_ref = isinstance(to_place, entities.ReferenceEntity)
+            if input_state.mouse_was_pressed() and not is_ref:
+                self._start_dragging(world)
+
+            if self.selected_item_placeable and (input_state.mouse_was_pressed() or
+                                                 (not is_ref and self._is_dragging(input_state, world))):
+                if to_place.is_ground():
+                    world.set_tile(*to_place.xy(), to_place.get_factory_id())
+                    if global_state.level_journal is not None:
+                        global_state.level_journal.record_tile_added(to_place.get_factory_id(), *to_place.xy())
+                    return True
 
-            if input_state.mouse_was_pressed() and self.selected_item_placeable:
                 new_entity = copy.deepcopy(to_place)
-                if isinstance(new_entity, entities.ReferenceEntity):
+                if is_ref:
                     ref_id = input("Enter reference id: ")
                     new_entity.set_ref_id(ref_id)
                 world.add_entity(new_entity)
+                if global_state.level_journal is not None:
+                    global_state.level_journal.record_added(new_entity)
                 # keep holding original object
                 return True
 
@@ -344,21 +382,37 @@ class HUD:
 
     def _handle_removing_item(self, input_state, world):
         if self.selected_item_to_place is None:
-            if input_state.mouse_in_window() and input_state.mouse_was_pressed():
+            if input_state.mouse_in_window() and (input_state.mouse_was_pressed() or
+                                                  self._is_dragging(input_state, world)):
+                self._start_dragging(world)
                 screen_pos = input_state.mouse_pos()
                 world_pos = world.to_world_pos(*screen_pos)
 
                 rm_ground = input_state.is_held(pygame.K_LSHIFT) or input_state.is_held(pygame.K_RSHIFT)
                 if rm_ground:
-                    ents = world.get_entities_at_point(world_pos, category="ground")
-                else:
-                    ents = world.get_entities_at_point(world_pos, not_category="ground")
-
-                if len(ents) > 0:
-                    return world.remove_entity(ents[0])
+                    tile_xy = tile_layer.tile_xy(*world_pos)
+                    removed_id = world.set_tile(tile_xy[0], tile_xy[1], None)
+                    if removed_id is not None and global_state.level_journal is not None:
+                        global_state.level_journal.record_tile_removed(removed_id, *tile_xy)
+                    return removed_id is not None
+
+                # actors and anything else that isn't in the level file can't be erased
+                ents = world.get_entities_at_point(world_pos, cond=level_journal.is_saved)
+                if len(ents) > 0 and world.remove_entity(ents[0]):
+                    if global_state.level_journal is not None:
+                        global_state.level_journal.record_removed(ents[0])
+                    return True
 
         return False
 
+    def _start_dragging(self, world):
+        if self.world_being_edited is None:
+            world.begin_edit()
+            self.world_being_edited = world
+
+    def _is_dragging(self, input_state, world):
+        return self.world_being_edited is world and input_state.mouse_is_held()
+
     def is_absorbing_inputs(self):
         absorbing = global_state.tick_counter - self.show_text_time < 2
         absorbing = absorbing or (self.is_showing_text() and self.text_queue_blocking)
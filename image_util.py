@@ -183,4 +183,8 @@ class Animation:
         return self.anim_id
 
     def ticks_per_frame(self):
-        return self.TPF
\ No newline at end of file
+        return self.TPF
+
+    def __deepcopy__(self, memo):
+        # animations are shared resources, so entities that get copied should keep pointing to the same ones
+        return self
\ No newline at end of file
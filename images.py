@@ -175,6 +175,16 @@ def draw_animated_sprite(screen, dest, animation, modifier=None, src_subset=None
     draw_sprite(screen, dest, src_rect, modifier=modifier)
 
 
+def get_sprite_source(animation, modifier="normal"):
+    """returns: (sheet, source rect) that draw_animated_sprite would blit for animation right now."""
+    src_rect = animation.rects[(global_state.tick_counter // animation.TPF) % len(animation.rects)]
+    if animation.custom_sheet() is not None:
+        modifier = animation.custom_sheet()
+    if modifier == "flipped":
+        src_rect = _flip_rect(src_rect)
+    return (get_sheet(modifier), src_rect)
+
+
 def draw_sprite(screen, dest, source_rect, modifier="normal"):
     if modifier == "flipped":
         source_rect = _flip_rect(source_rect)
@@ -0,0 +1,324 @@
+"""
+Reading and writing level files. There are two formats:
+
+Text (.txt), which is what the editor saves. A list of sections, each starting with a header line:
+    ##  REFERENCES  ##
+    ref_id, x, y
+    ## FACTORY ##
+    factory_id, x, y
+
+Binary (.lvl), which is a compact, chunk-indexed copy of a text file that can be loaded through mmap:
+    header:         magic, version, chunk_size, counts and offsets of the sections below
+    strings:        interned table of factory ids and ref ids (u16 length + utf-8 bytes each)
+    references:     (u32 string_idx, i32 x, i32 y) for each reference, in file order
+    chunk index:    (i32 chunk_x, i32 chunk_y, u32 first_record, u32 num_records) for each chunk
+    records:        (u32 seq, u32 string_idx, i32 x, i32 y) for each factory entity, grouped by chunk. seq is
+                    the entity's position in the text file, so converting back to text is lossless.
+"""
+
+import mmap
+import os
+import struct
+import sys
+import traceback
+
+import file_stuff
+
+
+TEXT_EXT = ".txt"
+BINARY_EXT = ".lvl"
+
+WALLS_HEADER = "##  WALLS  ##"
+DECOR_HEADER = "##  DECORATIONS  ##"
+GROUND_HEADER = "##  GROUND  ##"
+REF_HEADER = "##  REFERENCES  ##"
+FACTORY_HEADER = "## FACTORY ##"
+ALL_HEADERS = [WALLS_HEADER, DECOR_HEADER, GROUND_HEADER, FACTORY_HEADER, REF_HEADER]
+
+DEFAULT_CHUNK_SIZE = 32 * 8  # same as world.CHUNK_SIZE
+
+_MAGIC = b"HATELVL\0"
+_VERSION = 1
+_HEADER = struct.Struct("<8sHHIIIIIIII")  # magic, version, chunk_size, then (count, offset) of each section
+_STR_LEN = struct.Struct("<H")
+_REF = struct.Struct("<Iii")
+_INDEX = struct.Struct("<iiII")
+_RECORD = struct.Struct("<IIii")
+
+
+def chunk_key_for(x, y, chunk_size):
+    return (x - (x % chunk_size), y - (y % chunk_size))
+
+
+class LevelData:
+    """
+    The contents of a level file: reference records (ref_id, x, y) and factory records (factory_id, x, y).
+    """
+
+    def __init__(self, refs, records, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        refs: list of (ref_id, x, y), in file order
+        records: list of (factory_id, x, y), in file order
+        """
+        self.chunk_size = chunk_size
+        self._refs = refs
+        self._records = records
+        self._by_chunk = None  # chunk_key -> list of (factory_id, x, y)
+
+    def get_refs(self):
+        return self._refs
+
+    def get_records(self):
+        """returns: all factory records, in file order."""
+        return self._records
+
+    def num_records(self):
+        return len(self._records)
+
+    def _get_chunks(self):
+        if self._by_chunk is None:
+            self._by_chunk = {}
+            for rec in self._records:
+                key = chunk_key_for(rec[1], rec[2], self.chunk_size)
+                if key not in self._by_chunk:
+                    self._by_chunk[key] = []
+                self._by_chunk[key].append(rec)
+        return self._by_chunk
+
+    def chunk_keys(self):
+        return self._get_chunks().keys()
+
+    def get_records_in_chunk(self, key):
+        return self._get_chunks().get(key, [])
+
+    def close(self):
+        pass
+
+
+class BinaryLevelData(LevelData):
+    """A binary level file, memory-mapped so that chunks can be read without loading the whole thing."""
+
+    def __init__(self, filepath):
+        self._file = open(filepath, "rb")
+        self._mmap = None
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._read_header_and_index(filepath)
+        except Exception:
+            # truncated or corrupt files can fail anywhere in here, and shouldn't leave the file open
+            self.close()
+            raise
+
+    def _read_header_and_index(self, filepath):
+        header = _HEADER.unpack_from(self._mmap, 0)
+        magic, version, chunk_size = header[0:3]
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("not a level file (or wrong version): " + str(filepath))
+
+        n_strings, strings_offs, n_refs, refs_offs, n_chunks, index_offs, n_records, records_offs = header[3:]
+
+        strings = []
+        offs = strings_offs
+        for _ in range(0, n_strings):
+            length = _STR_LEN.unpack_from(self._mmap, offs)[0]
+            offs += _STR_LEN.size
+            strings.append(self._mmap[offs:offs + length].decode("utf-8"))
+            offs += length
+        self._strings = strings
+
+        refs = []
+        for str_idx, x, y in _REF.iter_unpack(self._mmap[refs_offs:refs_offs + n_refs * _REF.size]):
+            refs.append((strings[str_idx], x, y))
+
+        self._index = {}  # chunk_key -> (first_record, num_records)
+        for cx, cy, first, count in _INDEX.iter_unpack(self._mmap[index_offs:index_offs + n_chunks * _INDEX.size]):
+            self._index[(cx, cy)] = (first, count)
+
+        self._records_offs = records_offs
+        self._num_records = n_records
+
+        LevelData.__init__(self, refs, None, chunk_size=chunk_size)
+
+    def _read_records(self, first, count):
+        start = self._records_offs + first * _RECORD.size
+        view = memoryview(self._mmap)[start:start + count * _RECORD.size]
+        try:
+            return list(_RECORD.iter_unpack(view))
+        finally:
+            view.release()
+
+    def get_records(self):
+        if self._records is None:
+            raw = self._read_records(0, self._num_records)
+            raw.sort()
+            strings = self._strings
+            self._records = [(strings[rec[1]], rec[2], rec[3]) for rec in raw]
+        return self._records
+
+    def num_records(self):
+        return self._num_records
+
+    def chunk_keys(self):
+        return self._index.keys()
+
+    def get_records_in_chunk(self, key):
+        if key not in self._index:
+            return []
+        first, count = self._index[key]
+        strings = self._strings
+        return [(strings[rec[1]], rec[2], rec[3]) for rec in self._read_records(first, count)]
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def parse_text_lines(lines, filename_for_debug="level"):
+    """returns: LevelData"""
+    refs = []
+    records = []
+    last_header = None
+    cnt = 1
+    for line in lines:
+        try:
+            if line in ALL_HEADERS:
+                last_header = line
+            elif line == "" or last_header is None or line.startswith("#"):
+                pass
+            else:
+                items = line.split(", ")
+                if last_header == REF_HEADER:
+                    refs.append((items[0], int(items[1]), int(items[2])))
+                elif last_header == FACTORY_HEADER:
+                    records.append((items[0], int(items[1]), int(items[2])))
+        except (ValueError, IndexError):
+            print("ERROR\t error parsing entitiy in ", filename_for_debug, " on line ", cnt, ":\t", line)
+            traceback.print_exc()
+        cnt += 1
+    return LevelData(refs, records)
+
+
+def to_text_lines(data):
+    lines = [REF_HEADER]
+    for ref in data.get_refs():
+        lines.append("{}, {}, {}".format(ref[0], ref[1], ref[2]))
+    lines.append("")
+
+    lines.append(FACTORY_HEADER)
+    for rec in data.get_records():
+        lines.append("{}, {}, {}".format(rec[0], rec[1], rec[2]))
+    lines.append("")
+    return lines
+
+
+def write_text(data, filepath):
+    file_stuff.write_lines_to_file(to_text_lines(data), filepath)
+
+
+def write_binary(data, filepath, chunk_size=DEFAULT_CHUNK_SIZE):
+    strings = []
+    string_idxs = {}
+
+    def intern(s):
+        if s not in string_idxs:
+            string_idxs[s] = len(strings)
+            strings.append(s)
+        return string_idxs[s]
+
+    ref_bytes = b"".join(_REF.pack(intern(ref[0]), ref[1], ref[2]) for ref in data.get_refs())
+
+    by_chunk = {}
+    all_records = data.get_records()
+    for seq in range(0, len(all_records)):
+        fac_id, x, y = all_records[seq]
+        key = chunk_key_for(x, y, chunk_size)
+        if key not in by_chunk:
+            by_chunk[key] = []
+        by_chunk[key].append(_RECORD.pack(seq, intern(fac_id), x, y))
+
+    index_parts = []
+    record_parts = []
+    n_records = 0
+    for key in sorted(by_chunk.keys()):
+        chunk_records = by_chunk[key]
+        index_parts.append(_INDEX.pack(key[0], key[1], n_records, len(chunk_records)))
+        record_parts.extend(chunk_records)
+        n_records += len(chunk_records)
+
+    string_parts = []
+    for s in strings:
+        encoded = s.encode("utf-8")
+        string_parts.append(_STR_LEN.pack(len(encoded)) + encoded)
+    string_bytes = b"".join(string_parts)
+
+    strings_offs = _HEADER.size
+    refs_offs = strings_offs + len(string_bytes)
+    index_offs = refs_offs + len(ref_bytes)
+    records_offs = index_offs + _INDEX.size * len(index_parts)
+
+    header = _HEADER.pack(_MAGIC, _VERSION, chunk_size,
+                          len(strings), strings_offs,
+                          len(data.get_refs()), refs_offs,
+                          len(index_parts), index_offs,
+                          n_records, records_offs)
+
+    with open(filepath, "wb") as f:
+        f.write(header)
+        f.write(string_bytes)
+        f.write(ref_bytes)
+        f.write(b"".join(index_parts))
+        f.write(b"".join(record_parts))
+
+
+def read_text(filepath):
+    return parse_text_lines(file_stuff.read_lines_from_file(filepath), filename_for_debug=filepath)
+
+
+def read_level_data(path_without_ext):
+    """
+    Reads a level from its binary file if there is one that's up to date, otherwise from its text file.
+    returns: LevelData, which should be closed when the caller is done with it.
+    """
+    text_path = path_without_ext + TEXT_EXT
+    binary_path = path_without_ext + BINARY_EXT
+    if file_stuff.exists(binary_path):
+        if not file_stuff.exists(text_path) or os.path.getmtime(binary_path) >= os.path.getmtime(text_path):
+            try:
+                return BinaryLevelData(binary_path)
+            except (ValueError, struct.error, OSError):
+                print("ERROR\tfailed to read binary level, falling back to text: ", binary_path)
+                traceback.print_exc()
+        else:
+            print("WARN\tbinary level is older than its text file, ignoring it: ", binary_path)
+    return read_text(text_path)
+
+
+def convert_to_binary(path_without_ext):
+    data = read_text(path_without_ext + TEXT_EXT)
+    write_binary(data, path_without_ext + BINARY_EXT)
+    print("INFO\twrote ", path_without_ext + BINARY_EXT, " (", data.num_records(), " records)")
+
+
+def convert_to_text(path_without_ext):
+    data = BinaryLevelData(path_without_ext + BINARY_EXT)
+    try:
+        write_text(data, path_without_ext + TEXT_EXT)
+    finally:
+        data.close()
+    print("INFO\twrote ", path_without_ext + TEXT_EXT)
+
+
+if __name__ == "__main__":
+    # usage: python level_files.py [to_binary|to_text] levels/level_01 [levels/level_02 ...]
+    if len(sys.argv) < 3 or sys.argv[1] not in ("to_binary", "to_text"):
+        print("usage: python level_files.py [to_binary|to_text] path/to/level_without_ext ...")
+        sys.exit(1)
+    for arg in sys.argv[2:]:
+        if sys.argv[1] == "to_binary":
+            convert_to_binary(arg)
+        else:
+            convert_to_text(arg)
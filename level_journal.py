@@ -0,0 +1,211 @@
+import os
+import threading
+import traceback
+
+import entities
+import file_stuff
+import level_files
+
+JOURNAL_EXT = ".journal"
+COMPACTING_EXT = ".journal.compacting"
+
+# journal lines look like "add, white_wall, 32, 64" or "rm_ref, terminal_1, 1152, -96"
+ADD = "add"
+REMOVE = "rm"
+ADD_REF = "add_ref"
+REMOVE_REF = "rm_ref"
+ALL_OPS = [ADD, REMOVE, ADD_REF, REMOVE_REF]
+
+_file_locks = {}    # path_without_ext -> lock, see files_lock
+_file_locks_lock = threading.Lock()
+
+
+def files_lock(path_without_ext):
+    """
+    returns: lock that's held while a level's file and journal are being swapped around by a compaction.
+        Hold it while reading both of them, or the journaled edits could be gone from the journal but
+        not in the level file yet.
+    """
+    with _file_locks_lock:
+        if path_without_ext not in _file_locks:
+            _file_locks[path_without_ext] = threading.Lock()
+        return _file_locks[path_without_ext]
+
+
+def read_journal(path_without_ext):
+    """returns: list of (op, id, x, y) that haven't been compacted into the level file yet, oldest first."""
+    res = []
+    for ext in (COMPACTING_EXT, JOURNAL_EXT):
+        if file_stuff.exists(path_without_ext + ext):
+            res.extend(read_journal_file(path_without_ext + ext))
+    return res
+
+
+def read_journal_file(filepath):
+    res = []
+    for line in file_stuff.read_lines_from_file(filepath):
+        try:
+            items = line.split(", ")
+            if items[0] not in ALL_OPS:
+                raise ValueError("unknown journal op: " + items[0])
+            res.append((items[0], items[1], int(items[2]), int(items[3])))
+        except (ValueError, IndexError):
+            # probably the last line of a journal that didn't finish being written
+            print("WARN\tskipping bad journal line in ", filepath, ": ", line)
+    return res
+
+
+def apply_journal(data, ops):
+    """
+    Applying an op twice does the same thing as applying it once, so it's safe to replay a
+    journal that was partially compacted before the game crashed.
+    returns: new LevelData
+    """
+    refs = list(data.get_refs())
+    records = list(data.get_records())
+    for op, item_id, x, y in ops:
+        item = (item_id, x, y)
+        items = refs if op in (ADD_REF, REMOVE_REF) else records
+        if op in (ADD, ADD_REF):
+            if item not in items:
+                items.append(item)
+        elif item in items:
+            items.remove(item)
+    return level_files.LevelData(refs, records)
+
+
+def is_saved(entity):
+    """returns: whether entity is one of the things level files hold, i.e. something the editor can add or remove."""
+    if isinstance(entity, entities.ReferenceEntity):
+        return True
+    return entity.get_ref_id() is None and entity.get_factory_id() is not None and not entity.is_actor()
+
+
+def _to_op(entity, adding):
+    if not is_saved(entity):
+        return None
+    elif isinstance(entity, entities.ReferenceEntity):
+        return (ADD_REF if adding else REMOVE_REF, entity.get_ref_id(), entity.get_x(), entity.get_y())
+    else:
+        return (ADD if adding else REMOVE, entity.get_factory_id(), entity.get_x(), entity.get_y())
+
+
+class LevelJournal:
+    """
+    Records the editor's changes to a level as an append-only list of adds and removes, which gets
+    compacted into the level file on a background thread. Saving never has to walk the world.
+    """
+
+    def __init__(self, path_without_ext, compact_after=200):
+        """
+        compact_after: the journal is compacted automatically once it has this many ops.
+        """
+        self.path = path_without_ext
+        self.compact_after = compact_after
+        self.version = 0  # counts up every time an edit is recorded
+
+        self._num_ops = len(read_journal(path_without_ext))
+        self._compaction_thread = None
+
+    def record_added(self, entity):
+        self._record(_to_op(entity, True))
+
+    def record_removed(self, entity):
+        self._record(_to_op(entity, False))
+
+    def record_tile_added(self, factory_id, x, y):
+        self._record((ADD, factory_id, x, y))
+
+    def record_tile_removed(self, factory_id, x, y):
+        self._record((REMOVE, factory_id, x, y))
+
+    def _record(self, op):
+        if op is None:
+            return
+        with open(self.path + JOURNAL_EXT, "a") as f:
+            f.write("{}, {}, {}, {}\n".format(*op))
+        self.version += 1
+        self._num_ops += 1
+
+        # edits made during a compaction wait for the next one, instead of asking for it over and over
+        if self._num_ops >= self.compact_after and not self.is_compacting():
+            self.compact()
+
+    def reset(self):
+        """Forgets about the journal's ops, for when the level file was rewritten and the journal discarded."""
+        self._num_ops = 0
+
+    def is_compacting(self):
+        return self._compaction_thread is not None and self._compaction_thread.is_alive()
+
+    def compact(self):
+        """Starts merging the journal into the level file on a background thread."""
+        if self.is_compacting():
+            print("INFO\tlevel journal is already being compacted: ", self.path)
+            return
+
+        journal_path = self.path + JOURNAL_EXT
+        compacting_path = self.path + COMPACTING_EXT
+        with files_lock(self.path):
+            if file_stuff.exists(journal_path):
+                if file_stuff.exists(compacting_path):
+                    # leftover from a compaction that never finished
+                    lines = file_stuff.read_lines_from_file(journal_path)
+                    with open(compacting_path, "a") as f:
+                        for line in lines:
+                            f.write(line + "\n")
+                    os.remove(journal_path)
+                else:
+                    os.replace(journal_path, compacting_path)
+
+        # new edits go into a fresh journal from here on
+        self._num_ops = 0
+
+        if not file_stuff.exists(compacting_path):
+            return
+
+        self._compaction_thread = threading.Thread(target=self._compact, name="compacting " + self.path, daemon=True)
+        self._compaction_thread.start()
+
+    def _compact(self):
+        with files_lock(self.path):
+            self._compact_locked()
+
+    def _compact_locked(self):
+        compacting_path = self.path + COMPACTING_EXT
+        try:
+            ops = read_journal_file(compacting_path)
+            old_data = level_files.read_level_data(self.path)
+            try:
+                data = apply_journal(old_data, ops)
+            finally:
+                old_data.close()
+
+            _write_atomically(lambda p: level_files.write_text(data, p), self.path + level_files.TEXT_EXT)
+            binary_path = self.path + level_files.BINARY_EXT
+            if file_stuff.exists(binary_path):
+                _write_atomically(lambda p: level_files.write_binary(data, p), binary_path)
+
+            os.remove(compacting_path)
+            print("INFO\tcompacted ", len(ops), " journaled edit(s) into ", self.path + level_files.TEXT_EXT)
+        except:
+            print("ERROR\tfailed to compact level journal: ", compacting_path)
+            traceback.print_exc()
+
+    def wait(self):
+        """Blocks until the current compaction (if any) is finished."""
+        if self._compaction_thread is not None:
+            self._compaction_thread.join()
+
+
+def _write_atomically(write_func, filepath):
+    tmp_path = filepath + ".tmp"
+    write_func(tmp_path)
+    os.replace(tmp_path, filepath)
+
+
+def discard(path_without_ext):
+    """Deletes the level's journal files, for when the level file was rewritten from scratch."""
+    for ext in (COMPACTING_EXT, JOURNAL_EXT):
+        if file_stuff.exists(path_without_ext + ext):
+            os.remove(path_without_ext + ext)
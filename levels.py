@@ -1,11 +1,15 @@
 import enemies
 import entities
 import file_stuff
+import level_files
+import level_journal
 import settings
 import puzzles
 import global_state
 import entity_factory
+import tile_layer
 
+import threading
 import traceback
 
 ALL_LEVELS = {}  # name -> level
@@ -20,13 +24,7 @@ LEVEL_03 = "level_03"
 LEVEL_SEQ = [LEVEL_01, LEVEL_02, LEVEL_03]
 
 LEVELS_DIR = "levels/"
-LEVEL_EXT = ".txt"
-WALLS_HEADER = "##  WALLS  ##"
-DECOR_HEADER = "##  DECORATIONS  ##"
-GROUND_HEADER = "##  GROUND  ##"
-REF_HEADER = "##  REFERENCES  ##"
-FACTORY_HEADER = "## FACTORY ##"
-ALL_HEADERS = [WALLS_HEADER, DECOR_HEADER, GROUND_HEADER, FACTORY_HEADER, REF_HEADER]
+LEVEL_EXT = level_files.TEXT_EXT
 
 
 def get_level(level_id):
@@ -54,6 +52,7 @@ class Level:
         self.subtitle = subtitle
 
         self._used_refs = set()
+        self._build_lock = threading.Lock()  # levels can be built off the main thread
 
     def get_id(self):
         return self.level_id
@@ -87,11 +86,23 @@ class Level:
             entity.set_ref_id(ref_id)
             return entity
 
-    def build(self, world):
+    def show_title_card(self):
         global_state.hud.set_level_title_card(self.get_name(), self.get_subtitle())
 
+    def build(self, world, progress=None, streaming=False):
+        """
+        Fills world with this level's entities. Doesn't touch the HUD, so it's safe to call
+        from a loading thread.
+        progress: optional lambda(float in [0, 1])
+        streaming: if true, factory entities are left in the level file for the world to stream in.
+        """
+        with self._build_lock:
+            self._build(world, progress, streaming)
+
+    def _build(self, world, progress, streaming):
+        self._used_refs = set()
         try:
-            refs = load_from_level_file(world, self.get_id())
+            refs = load_from_level_file(world, self.get_id(), progress=progress, streaming=streaming)
             ref_entities = self.build_refs(refs, world)
 
             for e in ref_entities:
@@ -200,8 +211,7 @@ class _VoidLevel(Level):
     def __init__(self):
         Level.__init__(self, LEVEL_VOID, "Void", "?-?")
 
-    def build(self, world):
-        global_state.hud.set_level_title_card(self.get_name(), self.get_subtitle())
+    def build(self, world, progress=None, streaming=False):
         world.add_all_entities([entities.Wall(i*32, 120) for i in range(0, 3)])
 
     def get_player_start_position(self):
@@ -211,48 +221,62 @@ class _VoidLevel(Level):
         pass
 
 
-def load_from_level_file(world, filename):
+def load_from_level_file(world, filename, progress=None, streaming=False):
+    """
+    Reads the level from its binary file if there's an up-to-date one, otherwise from its text file,
+    then applies any editor changes that are still sitting in the level's journal.
+    progress: optional lambda(float in [0, 1]), called as entities are built.
+    streaming: if true, only the references are built, and the world is given the level file
+        so it can stream in the factory entities around the camera.
+    returns: dict of ref_id -> (x, y)
+    """
     if filename == LEVEL_VOID:
         print("WARN\ttried to load void level...?")
         return
 
-    refs = {}  # ref_id -> (x, y)
-    last_header = None
-    cnt = 1
     levels_dir = settings.CONFIGS["level_dir"]
-    lines = file_stuff.read_lines_from_file(levels_dir + filename + LEVEL_EXT)
-    for line in lines:
-        try:
-            if line in ALL_HEADERS:
-                last_header = line
-                print("INFO\tloading from section: ", last_header)
-            elif line == "":
-                pass
-            elif last_header is None or line.startswith("#"):
-                print("INFO\tskipping line: ", line)
-            else:
-                items = line.split(", ")
-                if last_header == REF_HEADER:
-                    xy = (int(items[1]), int(items[2]))
-                    refs[items[0]] = xy
-                    ref_entity = entities.ReferenceEntity(ref_id=items[0])
-                    ref_entity.set_xy(xy[0], xy[1])
-                    world.add_entity(ref_entity)
-
-                elif last_header == FACTORY_HEADER:
-                    fac_id = items[0]
-                    x = int(items[1])
-                    y = int(items[2])
-
+    with level_journal.files_lock(levels_dir + filename):  # the journal could be getting compacted right now
+        data = level_files.read_level_data(levels_dir + filename)
+        journal_ops = level_journal.read_journal(levels_dir + filename)
+    if len(journal_ops) > 0:
+        print("INFO\tapplying ", len(journal_ops), " journaled edit(s) to ", filename)
+        journaled_data = level_journal.apply_journal(data, journal_ops)
+        data.close()
+        data = journaled_data
+    try:
+        refs = {}  # ref_id -> (x, y)
+        for ref_id, x, y in data.get_refs():
+            refs[ref_id] = (x, y)
+            ref_entity = entities.ReferenceEntity(ref_id=ref_id)
+            ref_entity.set_xy(x, y)
+            world.add_entity(ref_entity)
+
+        if streaming:
+            world.set_streaming_source(data)
+            data = None  # the world owns it now
+            return refs
+
+        records = data.get_records()
+        cnt = 1
+        for fac_id, x, y in records:
+            try:
+                if tile_layer.is_tile(fac_id):
+                    world.set_tile(x, y, fac_id)
+                else:
                     fac = entity_factory.build(fac_id)
                     fac.set_xy(x, y)
                     world.add_entity(fac)
+            except ValueError:
+                print("ERROR\t error building entitiy in ", filename, ": ", (fac_id, x, y))
+                traceback.print_exc()
 
-        except ValueError:
-            print("ERROR\t error parsing entitiy in ", (filename + LEVEL_EXT), " on line ", cnt, ":\t", line)
-            traceback.print_exc()
+            if progress is not None:
+                progress(cnt / len(records))
+            cnt += 1
+    finally:
+        if data is not None:
+            data.close()
 
-        cnt += 1
     return refs
 
 
@@ -264,31 +288,29 @@ def save_to_level_file(world, filename):
     factory_created = []
     references = []
 
-    for e in world.get_entities_with(not_category="actor"):
-        if e.get_ref_id() is not None:
-            if isinstance(e, entities.ReferenceEntity):
-                references.append(e)
-            else:
-                # do nothing, this entity gets spawned by a reference entity
-                pass
-        elif e.get_factory_id() is not None:
-            factory_created.append(e)
-        else:
-            print("WARN\tdiscarding entity: ", e)
+    for e in world.get_entities_with(category="reference"):
+        references.append(e)
 
-    lines = list()
-    lines.append(REF_HEADER)
-    for ref in sorted(references, key=str):
-        lines.append("{}, {}, {}".format(ref.get_ref_id(), ref.get_x(), ref.get_y()))
-    lines.append("")
+    for e in world.get_entities_with_factory_id():
+        if e.get_ref_id() is None and not e.is_actor():
+            factory_created.append(e)
 
-    lines.append(FACTORY_HEADER)
-    for fac in sorted(factory_created, key=str):
-        lines.append("{}, {}, {}".format(fac.get_factory_id(), fac.get_x(), fac.get_y()))
-    lines.append("")
+    refs = [(ref.get_ref_id(), ref.get_x(), ref.get_y()) for ref in sorted(references, key=str)]
+    records = [(fac.get_factory_id(), fac.get_x(), fac.get_y()) for fac in sorted(factory_created, key=str)]
+    records.extend(sorted(world.get_tile_records()))
+    records.extend(world.get_unstreamed_records())
+    data = level_files.LevelData(refs, records)
 
     levels_dir = settings.CONFIGS["level_dir"]
-    file_stuff.write_lines_to_file(lines, levels_dir + filename + LEVEL_EXT)
+    with level_journal.files_lock(levels_dir + filename):
+        level_files.write_text(data, levels_dir + filename + level_files.TEXT_EXT)
+
+        binary_path = levels_dir + filename + level_files.BINARY_EXT
+        if file_stuff.exists(binary_path):
+            level_files.write_binary(data, binary_path)
+
+        # everything in the journal is in the file now
+        level_journal.discard(levels_dir + filename)
 
 
 print("\nINFO\tbuilding levels...")
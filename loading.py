@@ -0,0 +1,185 @@
+import threading
+import time
+import traceback
+
+import actors
+import levels
+import settings
+import snapshots
+import world
+
+
+BYTES_PER_ENTITY = 1024  # rough, measured with tracemalloc on level_01
+
+
+class LoadingJob:
+    """
+    Builds a level's World on a background thread, so the main loop can keep running
+    (and the title card can keep animating) while the level is parsed and warmed up.
+    """
+
+    def __init__(self, level_id, bake_layers=True, background=False):
+        """
+        bake_layers: whether to pre-render the static chunk layers too.
+        background: if true, the job yields to the main thread often so gameplay doesn't stutter.
+        """
+        self.level_id = level_id
+        self.level = levels.get_level(level_id)
+        self.bake_layers = bake_layers
+        self.background = background
+
+        self._progress = 0.0
+        self._world = None
+        self._layers = {}  # cache_key -> Surface, baked static chunk layers
+        self._snapshot = None
+        self._estimated_bytes = 0
+        self._progress_calls = 0
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="loading " + str(level_id), daemon=True)
+
+    def start(self):
+        print("INFO\tstarted loading level: ", self.level_id)
+        self._thread.start()
+        return self
+
+    def get_level(self):
+        return self.level
+
+    def get_progress(self):
+        """returns: float in [0, 1]"""
+        return self._progress
+
+    def is_done(self):
+        return self._done.is_set()
+
+    def get_world(self):
+        """returns: the finished World, or None if the job isn't done yet."""
+        return self._world if self.is_done() else None
+
+    def get_snapshot(self):
+        """returns: LevelSnapshot of the freshly built level, or None if it couldn't be built."""
+        return self._snapshot if self.is_done() else None
+
+    def get_baked_layers(self):
+        """returns: dict of cache_key -> Surface, which should be put into the image cache when the world goes live."""
+        return self._layers if self.is_done() else {}
+
+    def drop_baked_layers(self):
+        self._layers = {}
+        self._estimated_bytes = _estimate_bytes(self._world, self._layers)
+
+    def estimated_bytes(self):
+        """returns: rough size of the finished world and baked layers, or 0 if the job isn't done yet."""
+        return self._estimated_bytes if self.is_done() else 0
+
+    def _set_progress(self, start, end, val):
+        self._progress = start + (end - start) * val
+        self._progress_calls += 1
+        if self.background and self._progress_calls % 32 == 0:
+            time.sleep(0)  # let the main thread have the GIL
+
+    def _run(self):
+        new_world = None
+        try:
+            new_world = world.World()
+            streaming = settings.STREAM_LEVELS
+            self.level.build(new_world, progress=lambda x: self._set_progress(0, 0.6, x), streaming=streaming)
+
+            pos = self.level.get_player_start_pos()
+            if streaming:
+                # only the area around the player gets loaded, and there's no file to snapshot
+                new_world.recenter_camera(pos)
+                new_world.update_streaming(force=True)
+            new_world.update_all_wall_outlines(None)
+
+            if not streaming:
+                self._snapshot = snapshots.LevelSnapshot(self.level_id, new_world, pos)
+            self._set_progress(0, 0.8, 1)
+
+            player = actors.Player()
+            player.set_xy(pos[0], pos[1])
+            new_world.add_entity(player)
+
+            if self.bake_layers:
+                self._layers = new_world.bake_chunk_layers(progress=lambda x: self._set_progress(0.8, 1, x))
+        except:
+            print("ERROR\tfailed to finish loading level: ", self.level_id)
+            traceback.print_exc()
+            self._layers = {}
+            self._snapshot = None
+            if new_world is None or new_world.player() is None:
+                new_world = world.World()
+                new_world.add_entity(actors.Player())
+
+        self._world = new_world
+        self._estimated_bytes = _estimate_bytes(new_world, self._layers)
+        self._progress = 1.0
+        self._done.set()
+        print("INFO\tfinished loading level: ", self.level_id)
+
+
+def _estimate_bytes(world_to_measure, layers):
+    res = 0
+    for chunk in world_to_measure.chunks.values():
+        for e in chunk.entities:
+            res += BYTES_PER_ENTITY
+            if e.is_wall():
+                res += e.width() * e.height() * 4  # cached outline
+    for layer in layers.values():
+        res += layer.get_width() * layer.get_height() * 4
+    return res
+
+
+class Preloader:
+    """
+    Builds the levels that can be reached from the current one while it's being played, so
+    walking through a LevelEndDoor only costs a world swap.
+    """
+
+    def __init__(self, memory_cap_mb=settings.PRELOAD_MEMORY_CAP_MB):
+        self.memory_cap = memory_cap_mb * 1024 * 1024
+        self._jobs = {}  # level_id -> LoadingJob
+
+    def preload(self, level_ids):
+        """Starts loading the given levels, and forgets about any others that were preloaded."""
+        for level_id in list(self._jobs.keys()):
+            if level_id not in level_ids:
+                del self._jobs[level_id]
+
+        for level_id in level_ids:
+            if level_id not in self._jobs:
+                job = LoadingJob(level_id, bake_layers=settings.PRELOAD_CHUNK_LAYERS, background=True)
+                self._jobs[level_id] = job.start()
+
+    def take(self, level_id):
+        """returns: the (possibly unfinished) LoadingJob for the given level, or None if it isn't preloaded."""
+        if level_id in self._jobs:
+            job = self._jobs[level_id]
+            del self._jobs[level_id]
+            print("INFO	using preloaded level: ", level_id)
+            return job
+        return None
+
+    def clear(self):
+        self._jobs.clear()
+
+    def update(self):
+        """Keeps the finished jobs under the memory cap. Baked layers are dropped first, then whole levels."""
+        finished = [job for job in self._jobs.values() if job.is_done()]
+        total = sum(job.estimated_bytes() for job in finished)
+
+        for job in finished:
+            if total <= self.memory_cap:
+                return
+            if len(job.get_baked_layers()) > 0:
+                total -= job.estimated_bytes()
+                job.drop_baked_layers()
+                total += job.estimated_bytes()
+                print("INFO	dropped baked layers of preloaded level to save memory: ", job.level_id)
+
+        for job in finished:
+            if total <= self.memory_cap:
+                return
+            total -= job.estimated_bytes()
+            del self._jobs[job.level_id]
+            print("INFO	dropped preloaded level to save memory: ", job.level_id)
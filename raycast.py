@@ -0,0 +1,214 @@
+"""
+Raycasting, for hitscan weapons and line of sight. Walls are found by stepping through the world's wall tile
+grid one tile at a time from the start of the ray (a DDA walk), so only walls in tiles the ray actually
+crosses ever get looked at, and the walk stops at the first one. Anything else the ray can hit (enemies,
+say) is found with a few small spatial queries along the part of the ray in front of that wall.
+"""
+
+import math
+
+SEGMENT_LENGTH = 128    # the ray's split into pieces this long for the spatial queries
+BROADPHASE_PADDING = 8  # in case an entity's hit rect (see cast's rect_of) pokes out of its regular rect
+
+
+class RayHit:
+
+    def __init__(self, entity, dist, pt):
+        self.entity = entity
+        self.dist = dist    # from the start of the ray
+        self.pt = pt        # where the ray hit entity
+
+
+def ray_vs_rect(origin, direction, rect, max_dist):
+    """
+    direction: unit vector
+    returns: how far along the ray it enters rect (0 if origin's already inside), or None if it doesn't
+        within max_dist. Just touching an edge or corner doesn't count, like pygame.Rect.colliderect.
+    """
+    t_min = 0
+    t_max = max_dist
+    for axis in (0, 1):
+        o = origin[axis]
+        d = direction[axis]
+        lo = rect[axis]
+        hi = rect[axis] + rect[axis + 2]
+        if d == 0:
+            if o <= lo or o >= hi:
+                return None
+        else:
+            t1 = (lo - o) / d
+            t2 = (hi - o) / d
+            if t1 > t2:
+                t1, t2 = t2, t1
+            t_min = max(t_min, t1)
+            t_max = min(t_max, t2)
+            if t_min >= t_max:
+                return None
+    return t_min
+
+
+def _widen(rect, direction, thickness):
+    """returns: rect, grown sideways (relative to the ray) to account for the ray's thickness."""
+    if thickness <= 0:
+        return rect
+    grow_x = thickness * abs(direction[1])
+    grow_y = thickness * abs(direction[0])
+    return (rect[0] - grow_x / 2, rect[1] - grow_y / 2, rect[2] + grow_x, rect[3] + grow_y)
+
+
+class Raycaster:
+
+    def __init__(self, world, tile_size):
+        """tile_size: size of the world's wall tiles (see World.is_wall_tile)."""
+        self.world = world
+        self.tile_size = tile_size
+
+        self._los_cache = {}    # (pt1, pt2) -> bool, cleared every tick
+        self._tile_walls = {}   # (tx, ty) -> list of walls covering that tile, filled in as rays need them
+        self._wall_version = None   # when either cache was last valid
+
+    def start_tick(self):
+        self._los_cache.clear()
+
+    def _check_wall_version(self):
+        version = self.world.get_wall_version()
+        if version != self._wall_version:
+            self._los_cache.clear()
+            self._tile_walls.clear()
+            self._wall_version = version
+
+    def _walls_in_tile(self, tx, ty):
+        key = (tx, ty)
+        if key not in self._tile_walls:
+            ts = self.tile_size
+            self._tile_walls[key] = self.world.get_entities_in_rect([tx * ts, ty * ts, ts, ts], category="wall")
+        return self._tile_walls[key]
+
+    def _walk_tiles(self, origin, direction, max_dist):
+        """yields: (tx, ty, t) for each tile the ray passes through in order, t being where it enters the tile."""
+        ts = self.tile_size
+        x, y = origin
+        dx, dy = direction
+        tx = int(x // ts)
+        ty = int(y // ts)
+
+        if dx > 0:
+            step_x, t_next_x, t_delta_x = 1, ((tx + 1) * ts - x) / dx, ts / dx
+        elif dx < 0:
+            step_x, t_next_x, t_delta_x = -1, (tx * ts - x) / dx, -ts / dx
+        else:
+            step_x, t_next_x, t_delta_x = 0, math.inf, math.inf
+
+        if dy > 0:
+            step_y, t_next_y, t_delta_y = 1, ((ty + 1) * ts - y) / dy, ts / dy
+        elif dy < 0:
+            step_y, t_next_y, t_delta_y = -1, (ty * ts - y) / dy, -ts / dy
+        else:
+            step_y, t_next_y, t_delta_y = 0, math.inf, math.inf
+
+        t = 0
+        while t <= max_dist:
+            yield tx, ty, t
+            if t_next_x < t_next_y:
+                t = t_next_x
+                tx += step_x
+                t_next_x += t_delta_x
+            else:
+                t = t_next_y
+                ty += step_y
+                t_next_y += t_delta_y
+
+    def _first_wall(self, origin, direction, max_dist, thickness):
+        """returns: (wall, dist) for the first wall the ray hits, or (None, max_dist) if there isn't one."""
+        world = self.world
+        if thickness > 0:
+            # a band narrower than a tile can't cross a tile without one of its edges crossing it too
+            half = thickness / 2
+            perp = (-direction[1] * half, direction[0] * half)
+            walks = [(origin[0] + perp[0], origin[1] + perp[1]), (origin[0] - perp[0], origin[1] - perp[1])]
+        else:
+            walks = [origin]
+
+        best = None
+        best_dist = max_dist
+        seen = set()
+        for walk_origin in walks:
+            for tx, ty, t in self._walk_tiles(walk_origin, direction, best_dist):
+                if t >= best_dist:
+                    break
+                if not world.is_wall_tile(tx, ty):
+                    continue
+                for wall in self._walls_in_tile(tx, ty):
+                    if wall in seen:
+                        continue
+                    seen.add(wall)
+                    dist = ray_vs_rect(origin, direction, _widen(wall.get_rect(), direction, thickness), best_dist)
+                    if dist is not None and dist < best_dist:
+                        best = wall
+                        best_dist = dist
+        return best, best_dist
+
+    def _first_entity(self, origin, direction, max_dist, thickness, category, cond, rect_of):
+        """returns: (entity, dist) for the first matching entity the ray hits, or (None, max_dist)."""
+        best = None
+        best_dist = max_dist
+        seen = set()
+        pad = BROADPHASE_PADDING + thickness / 2
+        # a piece's bounding box only wastes space if the ray's diagonal
+        segment_length = SEGMENT_LENGTH if direction[0] != 0 and direction[1] != 0 else max_dist
+        start = 0
+        while start < best_dist:
+            end = min(start + segment_length, best_dist)
+            x1, y1 = origin[0] + direction[0] * start, origin[1] + direction[1] * start
+            x2, y2 = origin[0] + direction[0] * end, origin[1] + direction[1] * end
+            left, top = int(min(x1, x2) - pad), int(min(y1, y2) - pad)
+            query = [left, top, int(max(x1, x2) + pad) - left + 1, int(max(y1, y2) + pad) - top + 1]
+
+            for entity in self.world.iter_entities_in_rect(query, category=category, cond=cond):
+                if entity in seen:
+                    continue
+                seen.add(entity)
+                dist = ray_vs_rect(origin, direction, _widen(rect_of(entity), direction, thickness), best_dist)
+                if dist is not None and dist < best_dist:
+                    best = entity
+                    best_dist = dist
+            start = end  # stops once a hit's in front of the next piece
+        return best, best_dist
+
+    def cast(self, origin, direction, max_dist, category=None, cond=None, rect_of=None, thickness=0):
+        """
+        direction: doesn't have to be normalized.
+        category: what the ray can hit, besides walls (which always stop it). None for just walls.
+        rect_of: lambda(entity) -> the rect the ray has to hit, for entities in category. Defaults to their rect.
+        thickness: how wide the ray is, has to be less than a wall tile.
+        returns: RayHit for the first wall or entity in category along the ray, or None if it goes max_dist
+            without hitting anything.
+        """
+        length = math.sqrt(direction[0] ** 2 + direction[1] ** 2)
+        if length == 0:
+            return None
+        direction = (direction[0] / length, direction[1] / length)
+
+        self._check_wall_version()
+        hit, dist = self._first_wall(origin, direction, max_dist, thickness)
+        if category is not None:
+            entity, entity_dist = self._first_entity(origin, direction, dist, thickness, category, cond,
+                                                     rect_of or (lambda e: e.get_rect()))
+            if entity is not None:
+                hit, dist = entity, entity_dist
+
+        if hit is None:
+            return None
+        return RayHit(hit, dist, (origin[0] + direction[0] * dist, origin[1] + direction[1] * dist))
+
+    def has_line_of_sight(self, pt1, pt2):
+        """returns: whether there's no wall between pt1 and pt2. Remembered until the end of the tick."""
+        self._check_wall_version()
+        pt1 = (int(pt1[0]), int(pt1[1]))
+        pt2 = (int(pt2[0]), int(pt2[1]))
+        key = (pt1, pt2) if pt1 <= pt2 else (pt2, pt1)
+        if key not in self._los_cache:
+            dx, dy = key[1][0] - key[0][0], key[1][1] - key[0][1]
+            dist = math.sqrt(dx * dx + dy * dy)
+            self._los_cache[key] = dist == 0 or self.cast(key[0], (dx, dy), dist) is None
+        return self._los_cache[key]
@@ -16,7 +16,29 @@ FPS_THROTTLE = 1  # frames will only be drawn every X updates
 
 WAIT_TICKS_AFTER_DEATH = 75
 
-MAX_LIGHT_RADIUS = 128
+
+PRELOAD_NEXT_LEVELS = True      # build the levels reachable from the current one in the background
+PRELOAD_CHUNK_LAYERS = True     # also pre-render their static chunk layers (costs a lot more memory)
+PRELOAD_MEMORY_CAP_MB = 48      # preloaded levels that don't fit in this are dropped
+
+
+STREAM_LEVELS = False           # load the static parts of levels chunk-by-chunk around the camera
+STREAM_LOAD_MARGIN = 256        # chunks this far offscreen get loaded ahead of time...
+STREAM_UNLOAD_MARGIN = 768      # ...and chunks further than this get unloaded
+STREAM_CHUNKS_PER_TICK = 2      # max offscreen chunks to load per tick (onscreen ones are always loaded)
+
+
+SPATIAL_INDEX = "chunk_grid"    # or "loose_quadtree", see spatial.py
+MEMOIZE_QUERIES = False         # remember spatial query results for static things (walls etc.), see spatial.py
+
+
+JOURNAL_COMPACT_AFTER = 200     # editor changes are merged into the level file after this many (or on F5)
+
+
+AI_THINK_INTERVAL = 6           # enemies rethink their plans every this many ticks (staggered, so not all at once)
+AI_MAX_THINKS_PER_TICK = 8      # past this many, enemies that are due to think wait for the next tick
+FLOW_FIELD_RADIUS = 16          # in tiles. chasing enemies can path around walls this close to the player
+FLOW_FIELD_TILES_PER_TICK = 300  # how much of the flow field gets recomputed per tick after the player moves
 
 
 def get_light_blend_throttle_level():
@@ -0,0 +1,70 @@
+import copy
+
+import actors
+import decorations
+import entities
+import world
+
+# Entities of exactly these types never change during play, so snapshots can share them between worlds.
+_STATIC_TYPES = (entities.Wall, entities.Platform, entities.KillBlock, entities.Reverse, entities.ReferenceEntity,
+                 decorations.Decoration)
+
+
+def _is_static(entity):
+    return type(entity) in _STATIC_TYPES
+
+
+class LevelSnapshot:
+    """
+    The state of a freshly built level, used to restart it without rereading its level file. Static
+    geometry (along with its wall outlines and cached chunk layers) is shared by reference, while
+    everything else (including ground, which is cheap to copy) is copied.
+    """
+
+    def __init__(self, level_id, world, player_start_pos):
+        """Should be taken right after the level is built, before the world is updated."""
+        self.level_id = level_id
+        self.player_start_pos = player_start_pos
+
+        self._static = []
+        dynamic = []
+        for e in world.get_entities_with(not_category="actor"):
+            if _is_static(e):
+                self._static.append(e)
+            else:
+                dynamic.append(e)
+        self._dynamic = copy.deepcopy(dynamic)
+        self._tiles = [layer.copy() for layer in world.get_tile_layers().values()]
+
+        world.clear_static_edits()
+
+    def restore(self, prev_world):
+        """
+        prev_world: the world this snapshot was taken from (or one previously restored from it).
+        returns: a new World in the snapshotted state, with a new player.
+        """
+        new_world = world.World()
+        for e in self._static:
+            e.is_alive = True  # could have been removed in the editor
+            new_world.add_entity(e, invalidate=False)
+        for layer in self._tiles:
+            new_world.add_tile_layer(layer.copy())
+
+        for e in copy.deepcopy(self._dynamic):
+            new_world.add_entity(e)
+
+        # anything that changed since the snapshot was taken needs to be redrawn
+        for key in prev_world.get_static_edits():
+            chunk = new_world.get_chunk_from_key(key)
+            if chunk is not None:
+                chunk.mark_dirty()
+                for wall in chunk.entities.get_all(category="wall"):
+                    wall.set_outline_dirty(True)
+                    new_world.wake(wall)
+        new_world.clear_static_edits()
+
+        player = actors.Player()
+        player.set_xy(self.player_start_pos[0], self.player_start_pos[1])
+        new_world.add_entity(player)
+
+        return new_world
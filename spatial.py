@@ -0,0 +1,479 @@
+"""
+Spatial indexes, which answer "which entities are in this rect?" for a World. Entities always live in the
+world's chunks (that's how they get updated and drawn), the index is what queries go through.
+"""
+
+import heapq
+import itertools
+
+import cool_math
+
+CHUNK_GRID = "chunk_grid"
+LOOSE_QUADTREE = "loose_quadtree"
+ALL_TYPES = [CHUNK_GRID, LOOSE_QUADTREE]
+
+# categories that only things which never move have (World only re-indexes actors and overlays as they move),
+# so the answers to queries for them only change when entities are added or removed. See MemoizingIndex.
+STATIC_CATEGORIES = {"wall", "solid", "platform", "instakill", "reverse", "spawner", "reference", "zone",
+                     "decoration", "track", "door", "level_door", "terminal", "puzzle_terminal", "health_machine"}
+
+MAX_MEMOIZED_RESULTS = 4096  # past this, all the remembered results are thrown out
+
+NEAREST_START_RADIUS = 64  # nearest-neighbour searches start this far out, and double until they find enough
+
+
+def create(index_type, world, memoize=False):
+    """memoize: whether to remember query results for static things until they change (see MemoizingIndex)"""
+    if index_type == CHUNK_GRID:
+        res = ChunkGrid(world)
+    elif index_type == LOOSE_QUADTREE:
+        res = LooseQuadtree(world)
+    else:
+        raise ValueError("unknown spatial index type: " + str(index_type))
+    return MemoizingIndex(res) if memoize else res
+
+
+def _listify(category):
+    if category is None or isinstance(category, list):
+        return category
+    elif isinstance(category, str):
+        return [category]
+    else:
+        return list(category)
+
+
+def _matches(entity, categories, not_categories, rect, cond):
+    if categories is not None and not any(cat in entity.categories for cat in categories):
+        return False
+    if not_categories is not None and any(cat in entity.categories for cat in not_categories):
+        return False
+    if rect is not None and not entity.get_rect().colliderect(rect):
+        return False
+    return cond is None or cond(entity)
+
+
+def _dist_of(dist_and_entity):
+    return dist_and_entity[0]
+
+
+class SpatialIndex:
+
+    def __init__(self, world):
+        self.world = world
+
+    def add(self, entity, home_chunk):
+        """Called after entity was added to home_chunk."""
+        raise NotImplementedError()
+
+    def remove(self, entity):
+        """Called when entity is removed from the world."""
+        raise NotImplementedError()
+
+    def update(self, entity, home_chunk):
+        """Called after something that might have moved (like an actor) was updated."""
+        raise NotImplementedError()
+
+    def changing_chunks(self, entity):
+        """Called when entity is about to move to a different chunk. update gets called once it's there."""
+        pass
+
+    def start_tick(self):
+        pass
+
+    def get_entities_in_rect(self, rect, category=None, not_category=None, cond=None, limit=None):
+        """limit: max number of entities to return, in total."""
+        return list(itertools.islice(
+            self.iter_entities_in_rect(rect, category=category, not_category=not_category, cond=cond), limit))
+
+    def iter_entities_in_rect(self, rect, category=None, not_category=None, cond=None):
+        """Yields each matching entity once, searching lazily so the caller can stop early."""
+        raise NotImplementedError()
+
+    def any_in_rect(self, rect, category=None, not_category=None, cond=None):
+        for _ in self.iter_entities_in_rect(rect, category=category, not_category=not_category, cond=cond):
+            return True
+        return False
+
+    def get_entities_in_circle(self, center, radius, category=None, not_category=None, cond=None):
+        """returns: entities whose centers are within radius of center, nearest first."""
+        found = self._dists_in_circle(center, radius, category, not_category, cond)
+        found.sort(key=_dist_of)
+        return [e for _, e in found]
+
+    def get_nearest(self, pt, max_dist, k=1, category=None, not_category=None, cond=None):
+        """
+        returns: up to k entities whose centers are nearest to pt, nearest first.
+        max_dist: nothing farther away than this is returned (and the search stops there).
+        """
+        radius = NEAREST_START_RADIUS
+        while True:
+            radius = min(radius, max_dist)
+            found = self._dists_in_circle(pt, radius, category, not_category, cond)
+            if len(found) >= k or radius >= max_dist:
+                return [e for _, e in heapq.nsmallest(k, found, key=_dist_of)]
+            radius *= 2
+
+    def _dists_in_circle(self, center, radius, category, not_category, cond):
+        # the circle's bounding box, rounded out a bit. anything whose center is in the box touches it
+        r = int(radius) + 1
+        rect = [center[0] - r, center[1] - r, r * 2, r * 2]
+        res = []
+        for e in self.iter_entities_in_rect(rect, category=category, not_category=not_category, cond=cond):
+            d = cool_math.dist(center, e.center())
+            if d <= radius:
+                res.append((d, e))
+        return res
+
+    def get_entities_with(self, category=None, not_category=None, cond=None, limit=None):
+        # chunks keep their entities sorted by category, which is hard to beat for this
+        res = []
+        for chunk in self.world.chunks.values():
+            res.extend(chunk.entities.get_all(
+                category=category,
+                not_category=not_category,
+                cond=cond,
+                limit=limit))
+        return res
+
+
+class ChunkOverlaps:
+    """
+    Registers entities that hang over into chunks besides their own in those chunks' 'overlapping'
+    collections. Every index keeps one of these, since chunk drawing and the streamer read the chunks directly.
+    """
+
+    def __init__(self, world):
+        self.world = world
+        self._overlap_keys = {}  # entity -> keys of the chunks (besides its own) that its rect overlaps
+
+    def __len__(self):
+        return len(self._overlap_keys)
+
+    def __contains__(self, entity):
+        return entity in self._overlap_keys
+
+    def update(self, entity, home_chunk):
+        rect = entity.get_rect()
+        if home_chunk.rect.contains(rect):
+            keys = ()
+        else:
+            home_key = home_chunk.xy()
+            all_keys = self.world.get_chunk_keys_in_rect((rect.x, rect.y, rect.width - 1, rect.height - 1))
+            keys = tuple(k for k in all_keys if k != home_key)
+
+        old_keys = self._overlap_keys.get(entity, ())
+        if keys == old_keys:
+            return
+
+        for key in old_keys:
+            if key not in keys:
+                chunk = self.world.get_chunk_from_key(key)
+                if chunk is not None:
+                    chunk.overlapping.remove(entity)
+        for key in keys:
+            if key not in old_keys:
+                self.world.get_or_create_chunk(*key).overlapping.add(entity)
+
+        if len(keys) > 0:
+            self._overlap_keys[entity] = keys
+        else:
+            del self._overlap_keys[entity]
+
+    def remove(self, entity):
+        if entity in self._overlap_keys:
+            for key in self._overlap_keys[entity]:
+                chunk = self.world.get_chunk_from_key(key)
+                if chunk is not None:
+                    chunk.overlapping.remove(entity)
+            del self._overlap_keys[entity]
+
+
+class ChunkGrid(SpatialIndex):
+    """
+    Uses the world's chunks themselves, including their 'overlapping' collections (see ChunkOverlaps).
+    """
+
+    def __init__(self, world):
+        SpatialIndex.__init__(self, world)
+        self._overlaps = ChunkOverlaps(world)
+
+    def add(self, entity, home_chunk):
+        self._overlaps.update(entity, home_chunk)
+
+    def update(self, entity, home_chunk):
+        self._overlaps.update(entity, home_chunk)
+
+    def changing_chunks(self, entity):
+        self._overlaps.remove(entity)  # it might overlap its new chunk
+
+    def remove(self, entity):
+        self._overlaps.remove(entity)
+
+    def get_entities_in_rect(self, rect, category=None, not_category=None, cond=None, limit=None):
+        if limit is not None:
+            return SpatialIndex.get_entities_in_rect(self, rect, category=category, not_category=not_category,
+                                                     cond=cond, limit=limit)
+
+        chunks = self.world.get_chunks_in_rect(rect)
+        res = []
+        for chunk in chunks:
+            to_add = chunk.get_all(
+                category=category,
+                not_category=not_category,
+                rect=rect,
+                cond=cond)
+            res.extend(to_add)
+
+        if len(chunks) > 1 and len(self._overlaps) > 0:
+            res = list(dict.fromkeys(res))  # big entities are in more than one chunk
+        return res
+
+    def iter_entities_in_rect(self, rect, category=None, not_category=None, cond=None):
+        seen = None  # entities that are in more than one chunk, which have already been yielded
+        for chunk in self.world.iter_chunks_in_rect(rect):
+            for collection in (chunk.entities, chunk.overlapping):
+                if len(collection) == 0:
+                    continue
+                for e in collection.iter_all(category=category, not_category=not_category, rect=rect, cond=cond):
+                    if e in self._overlaps:
+                        if seen is None:
+                            seen = set()
+                        elif e in seen:
+                            continue
+                        seen.add(e)
+                    yield e
+
+    def any_in_rect(self, rect, category=None, not_category=None, cond=None):
+        for chunk in self.world.iter_chunks_in_rect(rect):
+            if chunk.any(category=category, not_category=not_category, rect=rect, cond=cond):
+                return True
+        return False
+
+
+class LooseQuadtree(SpatialIndex):
+    """
+    A loose quadtree, stored as one hash grid per level so it can cover an unbounded world. Each entity
+    goes in exactly one cell: the one containing its center, on the smallest level whose cells are at
+    least as big as the entity. Cells' bounds are loose (twice as wide as the cell), so a query only
+    has to look at the cells near it on each level, and nothing has to be split or merged as things move.
+    """
+
+    MIN_CELL_SIZE = 32
+    NUM_LEVELS = 8  # so the biggest cells are 32 * 2^7 = 4096 px
+
+    def __init__(self, world):
+        SpatialIndex.__init__(self, world)
+        self._cell_sizes = [LooseQuadtree.MIN_CELL_SIZE * (2 ** i) for i in range(0, LooseQuadtree.NUM_LEVELS)]
+        self._levels = [{} for _ in self._cell_sizes]   # level -> dict of (ix, iy) -> list of entities
+        self._level_counts = [0] * len(self._cell_sizes)
+        self._oversized = []    # entities too big for any level
+        self._where = {}        # entity -> (level, cell_key), level is -1 for oversized entities
+        self._overlaps = ChunkOverlaps(world)   # the quadtree doesn't need them, but the chunks' users do
+
+    def _place_for(self, rect):
+        size = max(rect.width, rect.height)
+        for level in range(0, len(self._cell_sizes)):
+            cell_size = self._cell_sizes[level]
+            if size <= cell_size:
+                return (level, (rect.centerx // cell_size, rect.centery // cell_size))
+        return (-1, None)
+
+    def add(self, entity, home_chunk):
+        self._overlaps.update(entity, home_chunk)
+        self._add_to_cell(entity)
+
+    def remove(self, entity):
+        self._overlaps.remove(entity)
+        self._remove_from_cell(entity)
+
+    def update(self, entity, home_chunk):
+        self._overlaps.update(entity, home_chunk)
+        if self._where.get(entity) != self._place_for(entity.get_rect()):
+            self._remove_from_cell(entity)
+            self._add_to_cell(entity)
+
+    def changing_chunks(self, entity):
+        self._overlaps.remove(entity)
+
+    def _add_to_cell(self, entity):
+        place = self._place_for(entity.get_rect())
+        level, key = place
+        if level < 0:
+            self._oversized.append(entity)
+        else:
+            cells = self._levels[level]
+            if key not in cells:
+                cells[key] = []
+            cells[key].append(entity)
+            self._level_counts[level] += 1
+        self._where[entity] = place
+
+    def _remove_from_cell(self, entity):
+        if entity not in self._where:
+            return
+        level, key = self._where.pop(entity)
+        if level < 0:
+            self._oversized.remove(entity)
+        else:
+            cells = self._levels[level]
+            cells[key].remove(entity)
+            if len(cells[key]) == 0:
+                del cells[key]
+            self._level_counts[level] -= 1
+
+    def iter_entities_in_rect(self, rect, category=None, not_category=None, cond=None):
+        categories = _listify(category)
+        not_categories = _listify(not_category)
+        x0, y0 = rect[0], rect[1]
+        x1, y1 = x0 + rect[2], y0 + rect[3]
+
+        for level in range(0, len(self._cell_sizes)):
+            if self._level_counts[level] == 0:
+                continue
+            cells = self._levels[level]
+            s = self._cell_sizes[level]
+            half = s // 2
+
+            # cells whose loose bounds (the cell plus half a cell on each side) touch the rect
+            ix_min, ix_max = (x0 - s - half) // s, (x1 + half) // s
+            iy_min, iy_max = (y0 - s - half) // s, (y1 + half) // s
+
+            if (ix_max - ix_min + 1) * (iy_max - iy_min + 1) <= len(cells):
+                for ix in range(ix_min, ix_max + 1):
+                    for iy in range(iy_min, iy_max + 1):
+                        cell = cells.get((ix, iy))
+                        if cell is not None:
+                            for e in cell:
+                                if _matches(e, categories, not_categories, rect, cond):
+                                    yield e
+            else:
+                for key in list(cells):
+                    if ix_min <= key[0] <= ix_max and iy_min <= key[1] <= iy_max:
+                        for e in cells[key]:
+                            if _matches(e, categories, not_categories, rect, cond):
+                                yield e
+
+        for e in self._oversized:
+            if _matches(e, categories, not_categories, rect, cond):
+                yield e
+
+
+class MemoizingIndex(SpatialIndex):
+    """
+    Wraps another index and remembers the results of rect queries for static things (walls, solids, zones...,
+    see STATIC_CATEGORIES), since the same questions get asked over and over, tick after tick (is_touching
+    in each direction for every actor that's standing still, uncollide, raycasts...). Those things never move,
+    so a result only has to be forgotten when something is added to or removed from its rect. Queries that
+    could match something that moves, or that have a cond (lambdas aren't comparable), go straight through.
+    """
+
+    def __init__(self, inner):
+        SpatialIndex.__init__(self, inner.world)
+        self.inner = inner
+        self._results = {}          # query key -> list of entities, or bool for any_in_rect
+        self._keys_by_chunk = {}    # chunk key -> set of query keys whose rects touch that chunk
+
+        self.hits = 0
+        self.misses = 0
+        self.uncacheable = 0
+
+    def _forget_rect(self, rect):
+        for chunk_key in self.world.get_chunk_keys_in_rect(rect):
+            query_keys = self._keys_by_chunk.get(chunk_key)
+            if query_keys is None:
+                continue
+            stale = [k for k in query_keys if rect.colliderect((k[1], k[2], k[3], k[4]))]
+            for query_key in stale:
+                query_keys.discard(query_key)
+                self._results.pop(query_key, None)
+
+    def add(self, entity, home_chunk):
+        self._forget_rect(entity.get_rect())
+        self.inner.add(entity, home_chunk)
+
+    def remove(self, entity):
+        self._forget_rect(entity.get_rect())
+        self.inner.remove(entity)
+
+    def update(self, entity, home_chunk):
+        self.inner.update(entity, home_chunk)
+
+    def changing_chunks(self, entity):
+        self.inner.changing_chunks(entity)
+
+    def start_tick(self):
+        if len(self._results) > MAX_MEMOIZED_RESULTS:
+            self._results.clear()
+            self._keys_by_chunk.clear()
+        self.inner.start_tick()
+
+    def _query_key(self, kind, rect, category, not_category, cond, limit):
+        """returns: key to remember the query's result by, or None if it can't be remembered."""
+        if cond is not None or category is None:
+            return None
+        if isinstance(category, str):
+            if category not in STATIC_CATEGORIES:
+                return None
+            category_key = category
+        else:
+            if any(c not in STATIC_CATEGORIES for c in category):
+                return None
+            category_key = tuple(category)
+        not_category_key = not_category if not_category is None or isinstance(not_category, str) else tuple(not_category)
+        return (kind, rect[0], rect[1], rect[2], rect[3], category_key, not_category_key, limit)
+
+    def _remember(self, query_key, rect, res):
+        self._results[query_key] = res
+        for chunk_key in self.world.get_chunk_keys_in_rect(rect):
+            if chunk_key not in self._keys_by_chunk:
+                self._keys_by_chunk[chunk_key] = set()
+            self._keys_by_chunk[chunk_key].add(query_key)
+
+    def get_entities_in_rect(self, rect, category=None, not_category=None, cond=None, limit=None):
+        query_key = self._query_key("rect", rect, category, not_category, cond, limit)
+        if query_key is None:
+            self.uncacheable += 1
+            return self.inner.get_entities_in_rect(rect, category=category, not_category=not_category,
+                                                   cond=cond, limit=limit)
+        res = self._results.get(query_key)
+        if res is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            res = self.inner.get_entities_in_rect(rect, category=category, not_category=not_category, limit=limit)
+            self._remember(query_key, rect, res)
+        return list(res)
+
+    def any_in_rect(self, rect, category=None, not_category=None, cond=None):
+        query_key = self._query_key("any", rect, category, not_category, cond, None)
+        if query_key is None:
+            self.uncacheable += 1
+            return self.inner.any_in_rect(rect, category=category, not_category=not_category, cond=cond)
+        res = self._results.get(query_key)
+        if res is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            res = self.inner.any_in_rect(rect, category=category, not_category=not_category)
+            self._remember(query_key, rect, res)
+        return res
+
+    def iter_entities_in_rect(self, rect, category=None, not_category=None, cond=None):
+        # callers that stop early are cheap already, and a partial result can't be remembered
+        return self.inner.iter_entities_in_rect(rect, category=category, not_category=not_category, cond=cond)
+
+    def get_nearest(self, pt, max_dist, k=1, category=None, not_category=None, cond=None):
+        return self.inner.get_nearest(pt, max_dist, k=k, category=category,
+                                      not_category=not_category, cond=cond)
+
+    def get_entities_in_circle(self, center, radius, category=None, not_category=None, cond=None):
+        return self.inner.get_entities_in_circle(center, radius, category=category,
+                                                 not_category=not_category, cond=cond)
+
+    def get_entities_with(self, category=None, not_category=None, cond=None, limit=None):
+        return self.inner.get_entities_with(category=category, not_category=not_category, cond=cond, limit=limit)
+
+    def get_stats_string(self):
+        total = max(1, self.hits + self.misses + self.uncacheable)
+        return "{} hits, {} misses, {} uncacheable ({:.1f}% hit rate)".format(
+            self.hits, self.misses, self.uncacheable, 100 * self.hits / total)
@@ -0,0 +1,126 @@
+"""
+Ground, kept as a grid of tile ids per chunk instead of as entities. Level files still list ground as
+factory records (e.g. "ground_stone, 32, 64"), but the world turns those into one small int each, in an
+array belonging to the chunk they're in. Ground never moves or does anything, so it doesn't need to be in
+the spatial index or get looked at by queries, it just has to be drawn into the chunk's static layer.
+"""
+
+import array
+
+import images
+
+TILE_SIZE = 32
+
+EMPTY = 0
+
+_ANIMATIONS = [None]    # tile id -> animation
+_FACTORY_IDS = [None]   # tile id -> factory id
+_TILE_IDS = {}          # factory id -> tile id
+
+
+def register(factory_id, animation):
+    """returns: tile id for factory_id. Registering the same factory id again just updates its animation."""
+    if factory_id in _TILE_IDS:
+        tile_id = _TILE_IDS[factory_id]
+        _ANIMATIONS[tile_id] = animation
+        return tile_id
+    if len(_ANIMATIONS) > 255:
+        raise ValueError("too many tile types")
+    _TILE_IDS[factory_id] = len(_ANIMATIONS)
+    _ANIMATIONS.append(animation)
+    _FACTORY_IDS.append(factory_id)
+    return _TILE_IDS[factory_id]
+
+
+def is_tile(factory_id):
+    return factory_id in _TILE_IDS
+
+
+def get_tile_id(factory_id):
+    if factory_id not in _TILE_IDS:
+        raise ValueError("unknown tile factory id: ", factory_id)
+    return _TILE_IDS[factory_id]
+
+
+def get_factory_id(tile_id):
+    return _FACTORY_IDS[tile_id]
+
+
+def tile_xy(x, y):
+    """returns: top left corner of the tile containing (x, y)."""
+    return (int(x // TILE_SIZE) * TILE_SIZE, int(y // TILE_SIZE) * TILE_SIZE)
+
+
+class TileLayer:
+
+    def __init__(self, x, y, size):
+        """
+        x, y: top left corner of the area the layer covers (its chunk).
+        size: width and height of that area, a multiple of TILE_SIZE.
+        """
+        self.x = x
+        self.y = y
+        self.n = size // TILE_SIZE    # tiles per row
+        self._tiles = array.array("B", bytes(self.n * self.n))
+        self._count = 0               # number of tiles that aren't EMPTY
+
+    def __len__(self):
+        return self._count
+
+    def _index(self, x, y):
+        tx = int(x - self.x) // TILE_SIZE
+        ty = int(y - self.y) // TILE_SIZE
+        if 0 <= tx < self.n and 0 <= ty < self.n:
+            return ty * self.n + tx
+        raise ValueError("point isn't in this tile layer: ", (x, y))
+
+    def get(self, x, y):
+        """returns: id of the tile containing (x, y)."""
+        return self._tiles[self._index(x, y)]
+
+    def set(self, x, y, tile_id):
+        """returns: id of the tile that was there before."""
+        i = self._index(x, y)
+        old_id = self._tiles[i]
+        self._tiles[i] = tile_id
+        self._count += (tile_id != EMPTY) - (old_id != EMPTY)
+        return old_id
+
+    def iter_tiles(self, rect=None):
+        """yields: (tile_id, x, y) for every tile that isn't EMPTY (and touches rect, if it's given)."""
+        n = self.n
+        tx_min, ty_min, tx_max, ty_max = 0, 0, n - 1, n - 1
+        if rect is not None:
+            tx_min = max(tx_min, int(rect[0] - self.x) // TILE_SIZE)
+            ty_min = max(ty_min, int(rect[1] - self.y) // TILE_SIZE)
+            tx_max = min(tx_max, int(rect[0] + rect[2] - 1 - self.x) // TILE_SIZE)
+            ty_max = min(ty_max, int(rect[1] + rect[3] - 1 - self.y) // TILE_SIZE)
+        tiles = self._tiles
+        for ty in range(ty_min, ty_max + 1):
+            row = ty * n
+            for tx in range(tx_min, tx_max + 1):
+                tile_id = tiles[row + tx]
+                if tile_id != EMPTY:
+                    yield tile_id, self.x + tx * TILE_SIZE, self.y + ty * TILE_SIZE
+
+    def get_records(self):
+        """returns: list of (factory_id, x, y) for every tile, same as in level files."""
+        return [(_FACTORY_IDS[tile_id], x, y) for tile_id, x, y in self.iter_tiles()]
+
+    def draw(self, surface, offset=(0, 0), rect=None):
+        """Draws every tile (or every tile touching rect) with one blits call."""
+        sources = {}  # tile id -> (sheet, source rect) for this frame
+        to_blit = []
+        for tile_id, x, y in self.iter_tiles(rect):
+            if tile_id not in sources:
+                sources[tile_id] = images.get_sprite_source(_ANIMATIONS[tile_id])
+            sheet, src_rect = sources[tile_id]
+            to_blit.append((sheet, (x + offset[0], y + offset[1]), src_rect))
+        if len(to_blit) > 0:
+            surface.blits(to_blit, doreturn=False)
+
+    def copy(self):
+        res = TileLayer(self.x, self.y, self.n * TILE_SIZE)
+        res._tiles = self._tiles[:]
+        res._count = self._count
+        return res
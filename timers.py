@@ -0,0 +1,73 @@
+"""
+A timer wheel, so entities that are just waiting for a countdown to run out can sleep (see
+Entity.needs_update) instead of being updated every tick to count it down.
+"""
+
+NUM_SLOTS = 256  # timers further out than this go around the wheel more than once
+
+
+class Timer:
+
+    def __init__(self, wheel, due, callback):
+        self._wheel = wheel
+        self.due = due
+        self.callback = callback
+        self._version = 0       # bumped whenever the timer's rescheduled or cancelled
+        self._active = True
+
+    def is_active(self):
+        """returns: whether the timer is still waiting to fire."""
+        return self._active
+
+    def remaining(self):
+        """returns: number of ticks until the timer fires, or 0 if it's not active."""
+        return max(0, self.due - self._wheel.now) if self._active else 0
+
+    def cancel(self):
+        self._active = False
+        self._version += 1
+
+    def reschedule(self, delay):
+        """Makes the timer fire delay ticks from now instead, even if it already fired or was cancelled."""
+        self._wheel._insert(self, self._wheel.now + max(1, delay))
+
+
+class TimerWheel:
+
+    def __init__(self):
+        self.now = 0
+        self._slots = [[] for _ in range(0, NUM_SLOTS)]  # each is a list of (timer, version)
+
+    def schedule(self, delay, callback=None):
+        """
+        delay: number of ticks from now. It's at least 1, timers never fire on the tick they're made.
+        callback: lambda(world), or None for a timer that's only there to be checked.
+        returns: Timer
+        """
+        timer = Timer(self, 0, callback)
+        self._insert(timer, self.now + max(1, delay))
+        return timer
+
+    def _insert(self, timer, due):
+        timer._version += 1
+        timer._active = True
+        timer.due = due
+        self._slots[due % NUM_SLOTS].append((timer, timer._version))
+
+    def advance(self, world):
+        """Moves the clock forward one tick and fires the timers that are due."""
+        self.now += 1
+        slot = self._slots[self.now % NUM_SLOTS]
+        if len(slot) == 0:
+            return
+        self._slots[self.now % NUM_SLOTS] = []
+
+        for timer, version in slot:
+            if version != timer._version:
+                continue  # it was rescheduled or cancelled after this entry was made
+            elif timer.due > self.now:
+                self._slots[timer.due % NUM_SLOTS].append((timer, version))  # not this time around
+            else:
+                timer._active = False
+                if timer.callback is not None:
+                    timer.callback(world)
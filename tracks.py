@@ -6,7 +6,7 @@ import images
 class TrackPiece(entities.Entity):
     def __init__(self):
         entities.Entity.__init__(self, 16, 16)
-        self.categories.update(["track"])
+        self.add_categories("track")
         self.has_neighbor = [False]*len(cool_math.Dir.ALL_DIRS)
 
     def has_neighbor_track(self, direction):
@@ -0,0 +1,115 @@
+"""
+Trigger volumes: areas (zones, acid, terminals' message areas...) that react to actors going in and out of
+them. Volumes are registered with the world once, and only actors that moved since last tick get their
+overlaps recomputed, so a level full of hazards costs nothing while nobody's near them.
+
+A trigger is anything with these methods:
+    get_trigger_rect()
+    actor_entered(actor, world)
+    actor_remains(actor, world)     called every tick the actor is updated and still inside
+    actor_left(actor, world)        also called when the actor is removed from the world
+Triggers are expected to stay put once they're in the world.
+"""
+
+CELL_SIZE = 128
+
+
+class TriggerSystem:
+
+    def __init__(self, world):
+        self.world = world
+        self._cells = {}        # (ix, iy) -> list of triggers whose rects touch that cell
+        self._rects = {}        # trigger -> its rect when it was added
+        self._inside = {}       # trigger -> set of actors inside it
+        self._actor_rects = {}  # actor -> (x, y, w, h) when its overlaps were last computed
+        self._actor_triggers = {}   # actor -> set of triggers it's inside
+
+    def __len__(self):
+        return len(self._rects)
+
+    def _cell_keys(self, rect):
+        x_min, x_max = rect[0] // CELL_SIZE, (rect[0] + rect[2] - 1) // CELL_SIZE
+        y_min, y_max = rect[1] // CELL_SIZE, (rect[1] + rect[3] - 1) // CELL_SIZE
+        for ix in range(x_min, x_max + 1):
+            for iy in range(y_min, y_max + 1):
+                yield (ix, iy)
+
+    def add(self, trigger):
+        if trigger in self._rects:
+            return
+        rect = trigger.get_trigger_rect()
+        self._rects[trigger] = rect
+        self._inside[trigger] = set()
+        for key in self._cell_keys(rect):
+            if key not in self._cells:
+                self._cells[key] = []
+            self._cells[key].append(trigger)
+
+        # actors already standing in it don't have to move to notice it
+        for actor in self.world.iter_entities_in_rect(rect, category="actor"):
+            self._actor_rects.pop(actor, None)
+
+    def remove(self, trigger):
+        rect = self._rects.pop(trigger, None)
+        if rect is None:
+            return
+        for key in self._cell_keys(rect):
+            cell = self._cells[key]
+            cell.remove(trigger)
+            if len(cell) == 0:
+                del self._cells[key]
+        for actor in self._inside.pop(trigger):
+            self._actor_triggers[actor].discard(trigger)
+
+    def remove_actor(self, actor):
+        """Called when actor leaves the world. Every trigger it was in gets an actor_left."""
+        self._actor_rects.pop(actor, None)
+        for trigger in self._actor_triggers.pop(actor, ()):
+            self._inside[trigger].discard(actor)
+            trigger.actor_left(actor, self.world)
+
+    def update_actor(self, actor):
+        """Called once per tick for each actor that was updated, after it's done moving."""
+        rect = actor.get_rect()
+        rect_key = (rect.x, rect.y, rect.width, rect.height)
+        old = self._actor_triggers.get(actor)
+
+        if self._actor_rects.get(actor) == rect_key:
+            if old is not None:
+                for trigger in list(old):
+                    trigger.actor_remains(actor, self.world)
+            return
+
+        self._actor_rects[actor] = rect_key
+        current = self._find_triggers(rect)
+        if old is None:
+            old = ()
+
+        if len(current) > 0:
+            self._actor_triggers[actor] = current
+        elif actor in self._actor_triggers:
+            del self._actor_triggers[actor]
+
+        for trigger in old:
+            if trigger not in current:
+                self._inside[trigger].discard(actor)
+                trigger.actor_left(actor, self.world)
+        for trigger in current:
+            if trigger in old:
+                trigger.actor_remains(actor, self.world)
+            else:
+                self._inside[trigger].add(actor)
+                trigger.actor_entered(actor, self.world)
+
+    def _find_triggers(self, rect):
+        res = set()
+        for key in self._cell_keys(rect):
+            cell = self._cells.get(key)
+            if cell is not None:
+                for trigger in cell:
+                    if rect.colliderect(self._rects[trigger]):
+                        res.add(trigger)
+        return res
+
+    def get_actors_inside(self, trigger):
+        return list(self._inside.get(trigger, ()))
@@ -0,0 +1,94 @@
+"""
+The exposed surfaces of the walls, as a graph of tile edges. An edge is (tx, ty, side): the side (a unit
+direction) of wall tile (tx, ty) that faces open space. Each edge knows the edge after it going clockwise
+around the wall it belongs to (and so, the one before it, going counterclockwise), whether that's straight
+ahead, around an outside corner, or up into an inside corner. Built from the tiles that walls fully cover
+(see World.is_solid_contour_tile), and only rebuilt around tiles that changed.
+"""
+
+SIDES = [(0, -1), (1, 0), (0, 1), (-1, 0)]
+
+
+def travel_dir(side, clockwise):
+    """returns: which way something crawling along the given side of a wall goes."""
+    return (-side[1], side[0]) if clockwise else (side[1], -side[0])
+
+
+class WallContours:
+
+    def __init__(self, is_wall_tile, tile_size):
+        """is_wall_tile: lambda(tx, ty) -> bool"""
+        self._is_wall = is_wall_tile
+        self.tile_size = tile_size
+        self._next_cw = {}      # edge -> next edge clockwise
+        self._next_ccw = {}     # edge -> next edge counterclockwise
+        self._edges_of_tile = {}  # (tx, ty) -> list of its exposed edges
+        self._dirty_tiles = set()
+
+    def tile_changed(self, tx, ty):
+        """Called when a tile becomes a wall or stops being one."""
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                self._dirty_tiles.add((tx + dx, ty + dy))
+
+    def _flush(self):
+        if len(self._dirty_tiles) == 0:
+            return
+        dirty = self._dirty_tiles
+        self._dirty_tiles = set()
+
+        removed = []
+        for tile in dirty:
+            for edge in self._edges_of_tile.pop(tile, ()):
+                nxt = self._next_cw.pop(edge)
+                if self._next_ccw.get(nxt) == edge:
+                    del self._next_ccw[nxt]
+                removed.append(edge)
+
+        for tile in dirty:
+            if not self._is_wall(*tile):
+                continue
+            edges = []
+            for side in SIDES:
+                if not self._is_wall(tile[0] + side[0], tile[1] + side[1]):
+                    edge = (tile[0], tile[1], side)
+                    edges.append(edge)
+                    nxt = self._find_next_cw(edge)
+                    self._next_cw[edge] = nxt
+                    self._next_ccw[nxt] = edge
+            if len(edges) > 0:
+                self._edges_of_tile[tile] = edges
+
+        for edge in removed:
+            if edge not in self._next_cw:
+                self._next_ccw.pop(edge, None)
+
+    def _find_next_cw(self, edge):
+        tx, ty, side = edge
+        d = travel_dir(side, True)
+        ahead = (tx + d[0], ty + d[1])
+        diagonal = (ahead[0] + side[0], ahead[1] + side[1])
+        if self._is_wall(*diagonal):
+            return (diagonal[0], diagonal[1], (-d[0], -d[1]))   # inside corner, climb up the wall ahead
+        elif self._is_wall(*ahead):
+            return (ahead[0], ahead[1], side)                   # flat, keep going
+        else:
+            return (tx, ty, d)                                  # outside corner, wrap around this tile
+
+    def next_edge(self, edge, clockwise):
+        """returns: the edge after this one, or None if edge isn't an exposed wall surface."""
+        self._flush()
+        return self._next_cw.get(edge) if clockwise else self._next_ccw.get(edge)
+
+    def edge_start(self, edge, clockwise):
+        """returns: the world position where something crawling along edge (in the given direction) gets on it."""
+        tx, ty, side = edge
+        ts = self.tile_size
+        d = travel_dir(side, clockwise)
+        cx = (tx + 0.5 + side[0] * 0.5 - d[0] * 0.5) * ts
+        cy = (ty + 0.5 + side[1] * 0.5 - d[1] * 0.5) * ts
+        return (cx, cy)
+
+    def __len__(self):
+        self._flush()
+        return len(self._next_cw)
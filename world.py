@@ -5,9 +5,20 @@ import image_cache
 import image_util
 import images
 import entities
+import entity_factory
+import entity_store
+import flow_field
 import global_state
+import ai_scheduler
 import cool_math
+import level_files
+import raycast
 import settings
+import spatial
+import tile_layer
+import timers
+import triggers
+import wall_contours
 
 CHUNK_SIZE = 32 * 8
 
@@ -15,25 +26,95 @@ AMBIENT_DARKNESS = 200
 
 DUMMY_CHUNK = None
 
+# categories that only a handful of entities have, so World keeps a set of each of them for quick lookups.
+# (categories that can change while an entity is in the world, like light_source, can't go here)
+SPARSE_CATEGORIES = {"door", "level_door", "terminal", "puzzle_terminal", "health_machine",
+                     "spawner", "reference", "zone", "player"}
+
+WALL_TILE_SIZE = 32        # size of the cells in the world's wall occupancy grid
+CONTOUR_TILE_SIZE = 16     # size of the cells the wall contours are traced on (small walls are 16x16)
+
+PATCH_BORDER = 16           # when a tile changes, this much of the chunk layer around it gets redrawn too
+MAX_PATCHES_PER_DRAW = 24   # past this many changes, it's cheaper to redraw the whole chunk layer
+
 
 class Chunk:
     def __init__(self, x, y):
         cs = CHUNK_SIZE
         self.rect = pygame.Rect(x, y, cs, cs)
+        # entities whose xy() is in this chunk. They get updated and drawn by this chunk.
         self.entities = entities.EntityCollection(name_for_debug="Chunk("+str(x)+", "+str(y)+") collection")
 
+        # entities from other chunks whose rects hang over into this one. Only used for queries.
+        self.overlapping = entities.EntityCollection(name_for_debug="Chunk("+str(x)+", "+str(y)+") overlaps")
+
+        self.tiles = None       # TileLayer with this chunk's ground, once it has some
+
+        self._dirty_rects = []  # parts of the cached static layer that need to be redrawn
+        self._active = {}       # entities that need to be updated, in the order they were added (values unused)
+
         dirs = [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]
         self._neighbors = [(x + d[0] * cs, y + d[1] * cs) for d in dirs]
 
-    def add(self, entity):
+    def add(self, entity, mark_dirty=True):
         self.entities.add(entity)
-        if entity.is_ground() or entity.is_wall():
-            self.mark_dirty()
+        if entity.needs_update():
+            self._active[entity] = None
+        if mark_dirty and entity.is_wall():
+            self.mark_dirty(entity.get_rect())
 
-    def remove(self, entity):
+    def remove(self, entity, mark_dirty=True):
         self.entities.remove(entity)
-        if entity.is_ground() or entity.is_wall():
-            self.mark_dirty()
+        self._active.pop(entity, None)
+        if mark_dirty and entity.is_wall():
+            self.mark_dirty(entity.get_rect())
+
+    def get_tile(self, x, y):
+        """returns: id of the ground tile containing (x, y), which has to be in this chunk."""
+        if self.tiles is None:
+            return tile_layer.EMPTY
+        return self.tiles.get(x, y)
+
+    def set_tile(self, x, y, tile_id):
+        """returns: id of the ground tile that was there before."""
+        if self.tiles is None:
+            if tile_id == tile_layer.EMPTY:
+                return tile_layer.EMPTY
+            self.tiles = tile_layer.TileLayer(self.rect.x, self.rect.y, CHUNK_SIZE)
+        old_id = self.tiles.set(x, y, tile_id)
+        if len(self.tiles) == 0:
+            self.tiles = None
+        return old_id
+
+    def get_all(self, category=None, not_category=None, rect=None, cond=None, limit=None):
+        """returns: entities in this chunk or overlapping it that match (see EntityCollection.get_all)."""
+        res = self.entities.get_all(category=category, not_category=not_category, rect=rect, cond=cond, limit=limit)
+        if len(self.overlapping) > 0:
+            res.extend(self.overlapping.get_all(category=category, not_category=not_category,
+                                                rect=rect, cond=cond, limit=limit))
+        return res
+
+    def any(self, category=None, not_category=None, rect=None, cond=None):
+        """returns: whether anything in this chunk or overlapping it matches, without building any lists."""
+        return (self.entities.any(category=category, not_category=not_category, rect=rect, cond=cond) or
+                (len(self.overlapping) > 0 and
+                 self.overlapping.any(category=category, not_category=not_category, rect=rect, cond=cond)))
+
+    def is_empty(self):
+        return len(self.entities) == 0 and len(self.overlapping) == 0 and self.tiles is None
+
+    def get_active(self):
+        """returns: the entities in this chunk that need to be updated."""
+        return list(self._active)
+
+    def is_active(self, entity):
+        return entity in self._active
+
+    def activate(self, entity):
+        self._active[entity] = None
+
+    def deactivate(self, entity):
+        self._active.pop(entity, None)
 
     def xy(self):
         rect = self.get_rect()
@@ -54,27 +135,64 @@ class Chunk:
     def _cache_key(self):
         return str(self.xy()) + "_walls_n_ground"
 
-    def mark_dirty(self):
-        """Must be called whenever something ~static~ changes"""
-        image_cache.remove_cached_image(self._cache_key())
+    def mark_dirty(self, rect=None):
+        """
+        Must be called whenever something ~static~ changes.
+        rect: the area that changed (in world coordinates), or None to throw away the whole cached layer.
+        """
+        if rect is None:
+            image_cache.remove_cached_image(self._cache_key())
+            self._dirty_rects = []
+        elif self.rect.colliderect(rect):
+            # outlines of the tiles around the change might be different too
+            self._dirty_rects.append(pygame.Rect(rect).inflate(PATCH_BORDER * 2, PATCH_BORDER * 2))
+
+    def has_static_layer(self):
+        return self.tiles is not None or self.entities.any(category="wall")
+
+    def render_static_layer(self):
+        """returns: new Surface containing this chunk's ground and walls."""
+        self._dirty_rects = []
+        layer = pygame.Surface(self.size(), flags=pygame.SRCALPHA)
+        new_offset = cool_math.neg(self.xy())
+        if self.tiles is not None:
+            self.tiles.draw(layer, new_offset)
+        for e in self.entities.get_all(category="wall"):
+            e.draw(layer, new_offset)
+        return layer
+
+    def patch_static_layer(self, layer):
+        """Redraws the dirty parts of a cached static layer in place."""
+        new_offset = cool_math.neg(self.xy())
+        for rect in self._dirty_rects:
+            clip = rect.clip(self.rect).move(*new_offset)
+            if clip.width == 0 or clip.height == 0:
+                continue
+            layer.set_clip(clip)
+            layer.fill((0, 0, 0, 0), clip)
+            # sprites can hang a little outside of their entities' rects
+            search_rect = rect.inflate(PATCH_BORDER * 2, PATCH_BORDER * 2)
+            if self.tiles is not None:
+                self.tiles.draw(layer, new_offset, rect=search_rect)
+            for e in self.entities.get_all(category="wall", rect=search_rect):
+                e.draw(layer, new_offset)
+        layer.set_clip(None)
+        self._dirty_rects = []
 
     def draw_nonactors(self, screen, offset):
-        if len(self.entities.get_all(category=["ground", "wall"], limit=1)) > 0:
+        if self.has_static_layer():
             key = self._cache_key()
             cache_img = image_cache.get_cached_image(key)
-            if cache_img is None:
-                cache_img = pygame.Surface(self.size(), flags=pygame.SRCALPHA)
-                new_offset = cool_math.neg(self.xy())
-                for g in self.entities.get_all(category="ground"):
-                    g.draw(cache_img, new_offset)
-                for e in self.entities.get_all(category="wall"):
-                    e.draw(cache_img, new_offset)
+            if cache_img is None or len(self._dirty_rects) > MAX_PATCHES_PER_DRAW:
+                cache_img = self.render_static_layer()
                 image_cache.put_cached_image(key, cache_img)
+            elif len(self._dirty_rects) > 0:
+                self.patch_static_layer(cache_img)
 
             screen_pos = cool_math.add(self.xy(), offset)
             screen.blit(cache_img, screen_pos)
 
-        special_stuff = ["ground", "wall", "actor", "overlay", "zone", "reference", "spawner", "reverse"]
+        special_stuff = ["wall", "actor", "overlay", "zone", "reference", "spawner", "reverse"]
         for e in self.entities.get_all(not_category=special_stuff):
             e.draw(screen, offset)
 
@@ -91,19 +209,8 @@ class Chunk:
             e.draw(screen, offset)
 
     def draw_darkness(self, world, screen, offset):
-        sources = []
-        max_range = settings.MAX_LIGHT_RADIUS
-
         rect = self.get_rect()
-        r = [rect.x - max_range, rect.y - max_range,
-             rect.width + max_range*2, rect.height + max_range*2]
-
-        for chunk in world.get_chunks_in_rect(r, and_above_and_left=False):
-            if chunk is not None:
-                for decoration in chunk.entities.get_all(category="light_source"):
-                    lp = decoration.light_profile()
-                    if lp is not None:
-                        sources.append(lp)
+        sources = world.get_light_profiles_in_rect(rect)
 
         img = image_util.get_darkness_overlay(rect, sources, AMBIENT_DARKNESS)
         screen.blit(img, cool_math.add(rect.topleft, offset))
@@ -118,7 +225,7 @@ class Chunk:
 
         if global_state.show_debug_rects:
             pygame.draw.rect(screen, (0, 0, 0), self.get_rect().move(*offset), 1)
-            for thing in self.entities.get_all(not_category="ground"):
+            for thing in self.entities:
                 pygame.draw.rect(screen, images.RAINBOW, thing.get_rect().move(*offset), 2)
                 if hasattr(thing, 'radius') and thing.radius > 2:
                     center = cool_math.add(thing.center(), offset)
@@ -135,12 +242,187 @@ class Chunk:
         return entity in self.entities
 
 
+class ChunkStreamer:
+    """
+    Loads the factory-built contents of chunks (walls, ground, decorations, spawners...) from a level
+    file as the camera approaches them, and unloads them again when it moves away. Everything else
+    (actors, doors, terminals, things built from references) stays in the world, so their state is kept.
+    """
+
+    def __init__(self, level_data):
+        if level_data.chunk_size != CHUNK_SIZE:
+            # regroup the records into our chunks
+            level_data = level_files.LevelData(level_data.get_refs(), level_data.get_records(), CHUNK_SIZE)
+        self.data = level_data
+
+        self._loaded = set()        # keys of chunks whose factory entities are in the world
+        self._modified = set()      # keys of loaded chunks whose factory entities were edited
+        self._overrides = {}        # chunk_key -> records, for unloaded chunks that were edited
+        self._spent = set()         # (factory_id, x, y) of spawners that already spawned their entity
+        self._is_loading = False
+
+    def is_loaded(self, key):
+        return key in self._loaded
+
+    def _has_records(self, key):
+        return key in self._overrides or key in self.data.chunk_keys()
+
+    def _get_records(self, key):
+        if key in self._overrides:
+            return self._overrides[key]
+        else:
+            return self.data.get_records_in_chunk(key)
+
+    def entity_changed(self, entity, key):
+        """Called when a factory entity is added to or removed from a chunk, e.g. by the editor."""
+        self.chunk_changed(key)
+
+    def chunk_changed(self, key):
+        """Called when a chunk's factory entities or ground tiles are changed."""
+        if not self._is_loading and key in self._loaded:
+            self._modified.add(key)
+
+    def update(self, world, force=False):
+        """
+        force: if true, all chunks in the loading margin are loaded this tick.
+        """
+        screen_rect = world.get_screen_rect()
+        onscreen_keys = set(world.get_chunk_keys_in_rect(screen_rect, and_above_and_left=True))
+
+        m = settings.STREAM_LOAD_MARGIN
+        load_rect = [screen_rect[0] - m, screen_rect[1] - m, screen_rect[2] + m*2, screen_rect[3] + m*2]
+        load_keys = [k for k in world.get_chunk_keys_in_rect(load_rect, and_above_and_left=True)
+                     if k not in self._loaded and self._has_records(k)]
+
+        if len(load_keys) > 0:
+            center = (screen_rect[0] + screen_rect[2] / 2, screen_rect[1] + screen_rect[3] / 2)
+            load_keys.sort(key=lambda k: cool_math.dist(center, k))
+            budget = settings.STREAM_CHUNKS_PER_TICK
+            for key in load_keys:
+                if force or key in onscreen_keys:
+                    self._load(world, key)
+                elif budget > 0:
+                    self._load(world, key)
+                    budget -= 1
+
+        m = settings.STREAM_UNLOAD_MARGIN
+        keep_rect = pygame.Rect(screen_rect[0] - m, screen_rect[1] - m, screen_rect[2] + m*2, screen_rect[3] + m*2)
+        for key in list(self._loaded):
+            if not keep_rect.colliderect([key[0], key[1], CHUNK_SIZE, CHUNK_SIZE]):
+                self._unload(world, key)
+
+        for key in list(world.chunks.keys()):
+            if world.chunks[key].is_empty() and key not in self._loaded:
+                del world.chunks[key]  # reclaim chunks left behind by wandering actors
+
+    def _load(self, world, key):
+        self._is_loading = True
+        try:
+            for fac_id, x, y in self._get_records(key):
+                if tile_layer.is_tile(fac_id):
+                    world.set_tile(x, y, fac_id)
+                    continue
+                try:
+                    e = entity_factory.build(fac_id)
+                except ValueError:
+                    print("ERROR\tunknown factory id in streamed chunk ", key, ": ", fac_id)
+                    continue
+                e.set_xy(x, y)
+                if (fac_id, x, y) in self._spent:
+                    e.did_spawn = True
+                world.add_entity(e)
+        finally:
+            self._is_loading = False
+
+        self._loaded.add(key)
+        if key in self._overrides:
+            del self._overrides[key]
+        world.get_or_create_chunk(*key)  # might have been empty
+
+    def _unload(self, world, key):
+        self._loaded.discard(key)
+        chunk = world.get_chunk_from_key(key)
+        if chunk is None:
+            return
+
+        to_drop = [e for e in chunk.entities if e.get_factory_id() is not None]
+        if key in self._modified:
+            self._overrides[key] = [(e.get_factory_id(), e.get_x(), e.get_y()) for e in to_drop]
+            if chunk.tiles is not None:
+                self._overrides[key].extend(chunk.tiles.get_records())
+            self._modified.discard(key)
+
+        world.begin_edit()  # so the outlines along the chunk's border are only recomputed once
+        try:
+            for e in to_drop:
+                if e.is_("spawner") and e.did_spawn:
+                    self._spent.add((e.get_factory_id(), e.get_x(), e.get_y()))
+                world.unload_entity(e, chunk=chunk)
+            world.unload_tiles(key)
+        finally:
+            world.commit_edit()
+
+        chunk.mark_dirty()
+        if chunk.is_empty():
+            del world.chunks[key]
+
+    def get_unloaded_records(self):
+        """returns: list of (factory_id, x, y) for everything that's in the level but not in the world right now."""
+        res = []
+        for key in self.data.chunk_keys():
+            if key not in self._loaded and key not in self._overrides:
+                res.extend(self.data.get_records_in_chunk(key))
+        for key in self._overrides:
+            res.extend(self._overrides[key])
+        return res
+
+    def close(self):
+        self.data.close()
+
+
 class World:
-    def __init__(self):
+    def __init__(self, spatial_index=None, memoize_queries=None):
+        """
+        spatial_index: which kind of spatial index to use for queries (see spatial.py), or None for the default.
+        memoize_queries: whether to remember query results for static things, or None for the default.
+        """
         self.camera = (0, 0)
         self._player = None
         self.chunks = {}
 
+        # keys of chunks whose level geometry (walls, ground, decorations...) has changed (see clear_static_edits)
+        self._static_edits = set()
+
+        # see begin_edit
+        self._edit_depth = 0
+        self._pending_static_rects = []
+        self._pending_chunk_keys = set()
+
+        self._streamer = None  # ChunkStreamer, if the level is being streamed in around the camera
+
+        # global indexes, kept up to date as entities are added and removed
+        self._doors = {}            # door_id -> Door
+        self._by_ref_id = {}        # ref_id -> set of entities
+        self._by_factory_id = {}    # factory_id -> set of entities
+        self._by_category = {cat: set() for cat in SPARSE_CATEGORIES}
+
+        self._store = entity_store.EntityStore()    # every entity's handle
+        self._lights = entity_store.ComponentTable(("x", "y", "radius"))  # for each light source that's shining
+
+        self._spatial = spatial.create(spatial_index or settings.SPATIAL_INDEX, self,
+                                       memoize=settings.MEMOIZE_QUERIES if memoize_queries is None else memoize_queries)
+        self._triggers = triggers.TriggerSystem(self)
+        self._timers = timers.TimerWheel()
+        self._ai = ai_scheduler.AIScheduler(settings.AI_MAX_THINKS_PER_TICK)
+
+        self._wall_tiles = {}   # (tx, ty) -> number of walls covering that tile
+        self._solid_contour_tiles = {}  # (tx, ty) -> number of walls covering all of that CONTOUR_TILE_SIZE tile
+        self._wall_version = 0  # counts up whenever a wall is added or removed
+        self._wall_contours = wall_contours.WallContours(self.is_solid_contour_tile, CONTOUR_TILE_SIZE)
+        self._flow_field = flow_field.FlowField(WALL_TILE_SIZE, settings.FLOW_FIELD_RADIUS,
+                                                settings.FLOW_FIELD_TILES_PER_TICK)
+        self._raycaster = raycast.Raycaster(self, WALL_TILE_SIZE)
+
         # counts up as player is missing (used to pause a bit before restarting level after deaths)
         self._missing_player_counter = 0
 
@@ -160,7 +442,7 @@ class World:
         else:
             return None
 
-    def get_chunk_keys_in_rect(self, rect, and_above_and_left=True):
+    def get_chunk_keys_in_rect(self, rect, and_above_and_left=False):
         xy_min = self.get_chunk_key_for_point(rect[0], rect[1])
         xy_max = self.get_chunk_key_for_point(rect[0] + rect[2], rect[1] + rect[3])
         xy_min = (int(xy_min[0] / CHUNK_SIZE), int(xy_min[1] / CHUNK_SIZE))
@@ -175,7 +457,21 @@ class World:
 
         return res
 
-    def get_chunks_in_rect(self, rect, and_above_and_left=True):
+    def iter_chunks_in_rect(self, rect):
+        """Yields the existing chunks that rect touches, one at a time."""
+        x_min, y_min = self.get_chunk_key_for_point(rect[0], rect[1])
+        x_max, y_max = self.get_chunk_key_for_point(rect[0] + rect[2], rect[1] + rect[3])
+        for x in range(x_min, x_max + 1, CHUNK_SIZE):
+            for y in range(y_min, y_max + 1, CHUNK_SIZE):
+                chunk = self.chunks.get((x, y))
+                if chunk is not None:
+                    yield chunk
+
+    def get_chunks_in_rect(self, rect, and_above_and_left=False):
+        """
+        and_above_and_left: also include the chunks above and to the left of the rect, which is where
+            entities that are drawn or updated in the rect might live.
+        """
         keys = self.get_chunk_keys_in_rect(rect, and_above_and_left=and_above_and_left)
         res = []
         for key in keys:
@@ -204,26 +500,76 @@ class World:
             for w in walls:
                 w.update(input_state, self)
 
+    def bake_chunk_layers(self, progress=None):
+        """
+        Renders the static layer of every chunk without touching the image cache, so it's safe
+        to call off the main thread (as long as nothing else is drawing this world).
+        progress: optional lambda(float in [0, 1])
+        returns: dict of cache_key -> Surface, ready to be put into the image cache.
+        """
+        res = {}
+        all_chunks = list(self.chunks.values())
+        for i in range(0, len(all_chunks)):
+            chunk = all_chunks[i]
+            if chunk.has_static_layer():
+                res[chunk._cache_key()] = chunk.render_static_layer()
+            if progress is not None:
+                progress((i + 1) / len(all_chunks))
+        return res
+
+    def set_streaming_source(self, level_data):
+        """Makes the world load level_data's factory entities chunk-by-chunk as the camera moves around."""
+        self._streamer = ChunkStreamer(level_data)
+
+    def is_streaming(self):
+        return self._streamer is not None
+
+    def update_streaming(self, force=False):
+        if self._streamer is not None:
+            self._streamer.update(self, force=force)
+
+    def get_unstreamed_records(self):
+        """returns: list of (factory_id, x, y) for the parts of a streamed level that aren't loaded right now."""
+        if self._streamer is None:
+            return []
+        return self._streamer.get_unloaded_records()
+
+    def close(self):
+        """Releases the level file, if the world is streaming from one."""
+        if self._streamer is not None:
+            self._streamer.close()
+
     def update_all(self, input_state):
+        self._spatial.start_tick()
+        self._timers.advance(self)
+        self._ai.start_tick()
+        self._raycaster.start_tick()
+        self.update_streaming()
+
         updating_chunks = self.get_chunks_to_update()
 
         for chunk in updating_chunks:
-            for entity in chunk.entities:
-                entity.update(input_state, self)
+            for entity in chunk.get_active():
+                if chunk.is_active(entity):  # an earlier update could have removed it
+                    entity.update(input_state, self)
 
         new_chunks = {}
+        all_moved_out = []
         for chunk in updating_chunks:
             dead = []
             moved_out = []
-            for entity in chunk.entities:
+            for entity in chunk.get_active():  # sleeping entities can't die or move
                 if not entity.is_alive:
                     dead.append(entity)
                 elif not chunk.get_rect().collidepoint(entity.xy()):
                     moved_out.append(entity)
+                elif not entity.needs_update():
+                    chunk.deactivate(entity)
             for entity in dead:
                 self.remove_entity(entity, chunk=chunk)
             for entity in moved_out:
                 chunk.remove(entity)
+                self._spatial.changing_chunks(entity)
 
                 key = self.get_chunk_key_for_point(*entity.xy())
                 moving_to = self.get_chunk_from_key(key)
@@ -237,6 +583,7 @@ class World:
                             and_add_to_dict=False)
                         new_chunks[key] = moving_to
                 moving_to.add(entity)
+                all_moved_out.append((entity, moving_to))
         self.chunks.update(new_chunks)
         updating_chunks.extend(new_chunks.values())
 
@@ -244,6 +591,22 @@ class World:
             for e in chunk.entities.get_all(category="actor"):
                 self.uncollide(e)
 
+        # static things never move, so only these need their places in the spatial index updated
+        for e, home_chunk in all_moved_out:
+            self._spatial.update(e, home_chunk)
+        for chunk in updating_chunks:
+            for e in chunk.entities.get_all(category=["actor", "overlay"]):
+                self._spatial.update(e, chunk)
+                if e.is_light_source():
+                    self._update_light(e, self._store.handle_of(e))
+
+        # actors are done moving, so zones, acid etc. can see who's in them
+        for chunk in updating_chunks:
+            for e in chunk.entities.get_all(category="actor"):
+                self._triggers.update_actor(e)
+
+        self._flow_field.update(self)
+
         p = self.player()
         if p is not None:
             for e in self.get_entities_in_rect(p.get_rect(), category="enemy"):
@@ -256,6 +619,28 @@ class World:
         else:
             self._missing_player_counter = 0
 
+    def schedule(self, delay, callback=None):
+        """
+        Sets a timer that goes off delay ticks from now (counting calls to update_all).
+        callback: lambda(world), or None
+        returns: timers.Timer, which can be cancelled or rescheduled.
+        """
+        return self._timers.schedule(delay, callback)
+
+    def should_think(self, agent):
+        """returns: whether it's agent's turn to make decisions this tick (see ai_scheduler.py)."""
+        return self._ai.should_think(agent, self.get_tick())
+
+    def get_tick(self):
+        """returns: number of times the world has been updated."""
+        return self._timers.now
+
+    def wake(self, entity):
+        """Makes the world start updating entity again, if it had stopped (see Entity.needs_update)."""
+        chunk = self.get_chunk(*entity.xy())
+        if chunk is not None and not chunk.is_active(entity) and entity in chunk.entities:
+            chunk.activate(entity)
+
     def recenter_camera(self, pos):
         x = round(pos[0] - global_state.WIDTH / 2)
         y = round(pos[1] - global_state.HEIGHT / 2)
@@ -271,16 +656,78 @@ class World:
         entity.is_alive = False
         if entity.is_player():
             self._player = None
+        self._record_static_edit(entity)
         if entity.is_wall():
-            r = entity.get_rect().inflate(2, 2)
-            for wall in self.get_entities_in_rect(r, category="wall"):
-                wall.set_outline_dirty(True)
-            for chunk in self.get_chunks_in_rect(r, and_above_and_left=False):
-                chunk.mark_dirty()
+            self._static_changed(entity.get_rect())
+
+    def _static_changed(self, rect):
+        """Must be called when a wall or ground tile is added to or removed from the given rect."""
+        r = rect.inflate(2, 2)
+        keys = self.get_chunk_keys_in_rect(r, and_above_and_left=False)
+        self._static_edits.update(keys)  # right away, even in the middle of a batch of edits
+        if self._edit_depth > 0:
+            self._pending_static_rects.append(r)
+            self._pending_chunk_keys.update(keys)
+            for key in keys:
+                chunk = self.get_chunk_from_key(key)
+                if chunk is not None:
+                    chunk.mark_dirty(r)  # cheap, the layer only gets patched when it's drawn
+        else:
+            self._apply_static_changes([r], keys)
+
+    def _apply_static_changes(self, rects, chunk_keys):
+        if len(rects) == 1:
+            walls = self.get_entities_in_rect(rects[0], category="wall")
+        else:
+            bounds = rects[0].unionall(rects[1:])
+            walls = self.get_entities_in_rect(bounds, category="wall",
+                                              cond=lambda w: w.get_rect().collidelist(rects) >= 0)
+        for wall in walls:
+            wall.set_outline_dirty(True)
+            self.wake(wall)
+        for key in chunk_keys:
+            chunk = self.get_chunk_from_key(key)
+            if chunk is not None:
+                for r in rects:
+                    chunk.mark_dirty(r)
+
+    def begin_edit(self):
+        """
+        Starts a batch of edits (e.g. the editor painting lots of tiles with one drag). Until the matching
+        commit_edit, the outlines around the edits aren't recomputed, so each wall's outline only gets
+        recomputed once per batch. Edits can be nested.
+        """
+        self._edit_depth += 1
+
+    def commit_edit(self):
+        if self._edit_depth == 0:
+            raise ValueError("commit_edit called without a matching begin_edit")
+        self._edit_depth -= 1
+        if self._edit_depth == 0 and len(self._pending_static_rects) > 0:
+            self._apply_static_changes(self._pending_static_rects, self._pending_chunk_keys)
+            self._pending_static_rects = []
+            self._pending_chunk_keys = set()
+
+    def is_editing(self):
+        return self._edit_depth > 0
+
+    def _record_static_edit(self, entity):
+        """Remembers that a piece of the level (which snapshots might share) was added or removed."""
+        if entity.is_actor() or (entity.get_factory_id() is None and entity.get_ref_id() is None):
+            return
+        keys = self.get_chunk_keys_in_rect(entity.get_rect().inflate(2, 2), and_above_and_left=False)
+        self._static_edits.update(keys)
+
+    def get_static_edits(self):
+        """returns: keys of all chunks whose level geometry changed since the last call to clear_static_edits."""
+        return self._static_edits
+
+    def clear_static_edits(self):
+        self._static_edits = set()
 
     def draw_all(self, screen):
         screen_rect = self.get_screen_rect()
-        chunks_to_draw = self.get_chunks_in_rect(screen_rect)
+        chunks_to_draw = self.get_chunks_in_rect(screen_rect, and_above_and_left=True)
 
         def sortkey(c):
             return -c.get_rect().x - c.get_rect().y
@@ -323,64 +770,291 @@ class World:
         return (self.camera[0], self.camera[1],
                 global_state.WIDTH, global_state.HEIGHT)
 
-    def add_entity(self, entity):
+    def add_entity(self, entity, invalidate=True):
+        """
+        invalidate: whether to dirty the outlines and cached chunk layers around the entity. Should only
+            be False when the caller knows those are already up to date (e.g. when restoring a snapshot).
+        """
         if entity.is_player():
             if self._player is not None:
                 raise ValueError("There is already a player in this world.")
             self._player = entity
 
         chunk = self.get_or_create_chunk(*entity.xy())
-        chunk.add(entity)
+        chunk.add(entity, mark_dirty=False)  # _static_changed takes care of it
+        self._index(entity)
+        self._spatial.add(entity, chunk)
 
-        if entity.is_wall() or entity.is_ground():
-            r = entity.get_rect().inflate(2, 2)
-            for wall in self.get_entities_in_rect(r, category="wall"):
-                wall.set_outline_dirty(True)
-            for chunk in self.get_chunks_in_rect(r, and_above_and_left=False):
-                chunk.mark_dirty()
+        if self._streamer is not None and entity.get_factory_id() is not None:
+            self._streamer.entity_changed(entity, chunk.xy())
+
+        if invalidate:
+            self._record_static_edit(entity)
+            if entity.is_wall():
+                self._static_changed(entity.get_rect())
 
     def add_all_entities(self, entity_list):
         for x in entity_list:
             self.add_entity(x)
 
     def remove_entity(self, entity, chunk=None):
+        return self._remove_entity(entity, chunk, True)
+
+    def unload_entity(self, entity, chunk=None):
+        """
+        Removes entity the same way as remove_entity, except that it isn't counted as an edit to a streamed
+        level. For when the streamer takes a chunk's contents out of the world (see ChunkStreamer).
+        """
+        return self._remove_entity(entity, chunk, False)
+
+    def unload_tiles(self, key):
+        """Drops all the ground in the chunk at key, for the streamer. Like unload_entity, it isn't an edit."""
+        chunk = self.get_chunk_from_key(key)
+        if chunk is not None and chunk.tiles is not None:
+            chunk.tiles = None
+            self._static_changed(chunk.get_rect())
+
+    def _remove_entity(self, entity, chunk, is_edit):
         if chunk is None:
             chunk = self.get_chunk(*entity.xy())
             if chunk is None:
                 return False
         if entity in chunk.entities:
             self._prepare_to_remove(entity)
-            chunk.remove(entity)
+            chunk.remove(entity, mark_dirty=False)  # _prepare_to_remove takes care of it
+            self._unindex(entity)
+            self._spatial.remove(entity)
+            if is_edit and self._streamer is not None and entity.get_factory_id() is not None:
+                self._streamer.entity_changed(entity, chunk.xy())
             return True
         else:
             return False
 
+    def _index(self, entity):
+        handle = self._store.add(entity)
+        if entity.is_light_source():
+            self._update_light(entity, handle)
+        if entity.is_door() and entity.door_id not in self._doors:
+            self._doors[entity.door_id] = entity
+        ref_id = entity.ref_id
+        if ref_id is not None:
+            if ref_id not in self._by_ref_id:
+                self._by_ref_id[ref_id] = set()
+            self._by_ref_id[ref_id].add(entity)
+        fac_id = entity.get_factory_id()
+        if fac_id is not None:
+            if fac_id not in self._by_factory_id:
+                self._by_factory_id[fac_id] = set()
+            self._by_factory_id[fac_id].add(entity)
+        for cat in entity.categories:
+            if cat in self._by_category:
+                self._by_category[cat].add(entity)
+        for trigger in entity.get_triggers():
+            self._triggers.add(trigger)
+        if entity.is_wall():
+            self._mark_wall_tiles(entity.get_rect(), 1)
+
+    def _unindex(self, entity):
+        if entity.is_door() and self._doors.get(entity.door_id) is entity:
+            del self._doors[entity.door_id]
+        ref_id = entity.ref_id
+        if ref_id in self._by_ref_id:
+            self._by_ref_id[ref_id].discard(entity)
+            if len(self._by_ref_id[ref_id]) == 0:
+                del self._by_ref_id[ref_id]
+        fac_id = entity.get_factory_id()
+        if fac_id in self._by_factory_id:
+            self._by_factory_id[fac_id].discard(entity)
+            if len(self._by_factory_id[fac_id]) == 0:
+                del self._by_factory_id[fac_id]
+        for cat in entity.categories:
+            if cat in self._by_category:
+                self._by_category[cat].discard(entity)
+        for trigger in entity.get_triggers():
+            self._triggers.remove(trigger)
+        if entity.is_actor():
+            self._triggers.remove_actor(entity)
+        self._lights.remove(self._store.handle_of(entity))
+        self._store.remove(entity)
+        if entity.is_wall():
+            self._mark_wall_tiles(entity.get_rect(), -1)
+
+    def get_tile(self, x, y):
+        """returns: factory id of the ground tile containing (x, y), e.g. "ground_stone", or None."""
+        chunk = self.get_chunk(x, y)
+        if chunk is None:
+            return None
+        return tile_layer.get_factory_id(chunk.get_tile(x, y))
+
+    def set_tile(self, x, y, factory_id, invalidate=True):
+        """
+        Puts ground on the tile containing (x, y), or clears it if factory_id is None.
+        invalidate: same as for add_entity.
+        returns: factory id of the ground that was there before, or None.
+        """
+        tile_id = tile_layer.EMPTY if factory_id is None else tile_layer.get_tile_id(factory_id)
+        if tile_id == tile_layer.EMPTY:
+            chunk = self.get_chunk(x, y)
+            if chunk is None:
+                return None
+        else:
+            chunk = self.get_or_create_chunk(x, y)
+        old_id = chunk.set_tile(x, y, tile_id)
+        if old_id != tile_id:
+            if self._streamer is not None:
+                self._streamer.chunk_changed(chunk.xy())
+            if invalidate:
+                tx, ty = tile_layer.tile_xy(x, y)
+                self._static_changed(pygame.Rect(tx, ty, tile_layer.TILE_SIZE, tile_layer.TILE_SIZE))
+        return tile_layer.get_factory_id(old_id)
+
+    def get_tile_records(self):
+        """returns: list of (factory_id, x, y) for all the ground in the world, same as in level files."""
+        res = []
+        for chunk in self.chunks.values():
+            if chunk.tiles is not None:
+                res.extend(chunk.tiles.get_records())
+        return res
+
+    def get_tile_layers(self):
+        """returns: dict of chunk key -> TileLayer, for every chunk with ground. Don't modify them."""
+        return {key: chunk.tiles for key, chunk in self.chunks.items() if chunk.tiles is not None}
+
+    def add_tile_layer(self, layer):
+        """Gives a chunk (that doesn't have any ground yet) all the ground in layer, without invalidating anything."""
+        chunk = self.get_or_create_chunk(layer.x, layer.y)
+        if chunk.tiles is not None:
+            raise ValueError("chunk already has ground: ", chunk.xy())
+        chunk.tiles = layer
+
+    def _mark_wall_tiles(self, rect, delta):
+        ts = WALL_TILE_SIZE
+        for tx in range(rect.x // ts, (rect.x + rect.width - 1) // ts + 1):
+            for ty in range(rect.y // ts, (rect.y + rect.height - 1) // ts + 1):
+                old_n = self._wall_tiles.get((tx, ty), 0)
+                n = old_n + delta
+                if n > 0:
+                    self._wall_tiles[(tx, ty)] = n
+                else:
+                    self._wall_tiles.pop((tx, ty), None)
+
+        # only tiles a wall covers completely go into the contours, so crawlers never follow a surface that isn't there
+        ts = CONTOUR_TILE_SIZE
+        for tx in range(-(-rect.x // ts), (rect.x + rect.width) // ts):
+            for ty in range(-(-rect.y // ts), (rect.y + rect.height) // ts):
+                old_n = self._solid_contour_tiles.get((tx, ty), 0)
+                n = old_n + delta
+                if n > 0:
+                    self._solid_contour_tiles[(tx, ty)] = n
+                else:
+                    self._solid_contour_tiles.pop((tx, ty), None)
+                if (old_n > 0) != (n > 0):
+                    self._wall_contours.tile_changed(tx, ty)
+        self._wall_version += 1
+
+    def is_wall_tile(self, tx, ty):
+        """returns: whether any wall covers part of the WALL_TILE_SIZE tile at (tx, ty) (in tiles, not pixels)."""
+        return (tx, ty) in self._wall_tiles
+
+    def is_solid_contour_tile(self, tx, ty):
+        """returns: whether a wall covers all of the CONTOUR_TILE_SIZE tile at (tx, ty) (in tiles, not pixels)."""
+        return (tx, ty) in self._solid_contour_tiles
+
+    def get_wall_version(self):
+        return self._wall_version
+
+    def get_wall_contours(self):
+        """returns: the graph of exposed wall surfaces (see wall_contours.py), kept up to date as walls change."""
+        return self._wall_contours
+
+    def get_direction_to_player(self, pt):
+        """
+        returns: unit vector for something at pt to head in to reach the player without running into walls,
+            or None if pt is too far away (or too close) for the flow field to help.
+        """
+        return self._flow_field.get_direction(self, pt)
+
+    def raycast(self, origin, direction, max_dist, category=None, cond=None, rect_of=None, thickness=0):
+        """returns: RayHit (see raycast.py) for the first wall or entity in category along the ray, or None."""
+        return self._raycaster.cast(origin, direction, max_dist, category=category, cond=cond, rect_of=rect_of,
+                                    thickness=thickness)
+
+    def has_line_of_sight(self, pt1, pt2):
+        """returns: whether no wall is in the way between pt1 and pt2."""
+        return self._raycaster.has_line_of_sight(pt1, pt2)
+
+    def get_handle(self, entity):
+        """returns: entity's handle (see entity_store.py), or None if it isn't in the world."""
+        return self._store.handle_of(entity)
+
+    def get_entity(self, handle):
+        """returns: the entity with this handle, or None if it's been removed from the world."""
+        return self._store.get(handle)
+
+    def _update_light(self, entity, handle):
+        lp = entity.light_profile()
+        if lp is None:
+            self._lights.remove(handle)
+        else:
+            self._lights.add(handle, lp[0], lp[1], lp[3])
+
+    def get_light_profiles_in_rect(self, rect):
+        """returns: light_profile() of every light source whose light reaches into rect."""
+        x_min, y_min = rect[0], rect[1]
+        x_max, y_max = rect[0] + rect[2], rect[1] + rect[3]
+        res = []
+        for x, y, radius in zip(self._lights.column("x"), self._lights.column("y"), self._lights.column("radius")):
+            if x_min - radius < x < x_max + radius and y_min - radius < y < y_max + radius:
+                res.append((int(x), int(y), 255, int(radius)))
+        return res
+
+    def get_entities_with_ref_id(self, ref_id):
+        return list(self._by_ref_id.get(ref_id, ()))
+
+    def get_entities_with_factory_id(self, factory_id=None):
+        """factory_id: if None, returns every entity that was built by the entity factory."""
+        if factory_id is None:
+            res = []
+            for ents in self._by_factory_id.values():
+                res.extend(ents)
+            return res
+        return list(self._by_factory_id.get(factory_id, ()))
+
     def player(self):
         return self._player
 
     def get_entities_in_circle(self, center, radius, category=None, not_category=None, cond=None):
-        rect = [center[0] - radius, center[1] - radius, radius * 2, center[1] * 2]
+        """returns: entities whose centers are within radius of center, nearest first."""
+        return self._spatial.get_entities_in_circle(center, radius, category=category, not_category=not_category,
+                                                    cond=cond)
 
-        def in_circle(x):
-            return cool_math.dist(x.center(), center) <= radius
+    def get_nearest_entities(self, pt, max_dist, k=1, category=None, not_category=None, cond=None):
+        """
+        returns: up to k entities whose centers are nearest to pt, nearest first.
+        max_dist: entities farther away than this are ignored. The search never looks past it, so keep it small.
+        """
+        return self._spatial.get_nearest(pt, max_dist, k=k, category=category,
+                                         not_category=not_category, cond=cond)
 
-        return self.get_entities_in_rect(
-            rect,
-            category=category,
-            not_category=not_category,
-            cond=lambda x: in_circle(x) and (cond is None or cond(x)))
+    def get_nearest_entity(self, pt, max_dist, category=None, not_category=None, cond=None):
+        """returns: the entity within max_dist whose center is nearest to pt, or None"""
+        res = self.get_nearest_entities(pt, max_dist, k=1, category=category,
+                                        not_category=not_category, cond=cond)
+        return res[0] if len(res) > 0 else None
 
     def get_entities_in_rect(self, rect, category=None, not_category=None, cond=None, limit=None):
-        res = []
-        for chunk in self.get_chunks_in_rect(rect):
-            to_add = chunk.entities.get_all(
-                category=category,
-                not_category=not_category,
-                rect=rect,
-                cond=cond,
-                limit=limit)
-            res.extend(to_add)
-        return res
+        """limit: max number of entities to return, in total."""
+        return self._spatial.get_entities_in_rect(rect, category=category, not_category=not_category,
+                                                  cond=cond, limit=limit)
+
+    def iter_entities_in_rect(self, rect, category=None, not_category=None, cond=None):
+        """Like get_entities_in_rect, but finds the entities lazily, so breaking out of the loop early
+        skips the rest of the search. Don't add or remove entities while iterating."""
+        return self._spatial.iter_entities_in_rect(rect, category=category, not_category=not_category, cond=cond)
+
+    def any_in_rect(self, rect, category=None, not_category=None, cond=None):
+        """returns: whether any entity matching the filters is in rect. Stops at the first one."""
+        return self._spatial.any_in_rect(rect, category=category, not_category=not_category, cond=cond)
 
     def get_entities_at_point(self, pt, category=None, not_category=None, cond=None, limit=None):
         return self.get_entities_in_rect(
@@ -391,21 +1065,27 @@ class World:
             limit=limit)
 
     def get_entities_with(self, category=None, not_category=None, cond=None, limit=None):
+        if isinstance(category, str) and category in self._by_category:
+            return self._get_sparse_entities_with(category, not_category, cond, limit)
+
+        return self._spatial.get_entities_with(category=category, not_category=not_category,
+                                               cond=cond, limit=limit)
+
+    def _get_sparse_entities_with(self, category, not_category, cond, limit):
+        if isinstance(not_category, str):
+            not_category = [not_category]
         res = []
-        for chunk in self.chunks.values():
-            res.extend(chunk.entities.get_all(
-                category=category,
-                not_category=not_category,
-                cond=cond,
-                limit=limit))
+        for e in self._by_category[category]:
+            if not_category is not None and any(e.is_(not_cat) for not_cat in not_category):
+                continue
+            if cond is None or cond(e):
+                res.append(e)
+                if limit is not None and len(res) >= limit:
+                    break
         return res
 
     def get_door(self, door_id):
-        matches = self.get_entities_with(cond=lambda x: x.is_door() and x.door_id == door_id, limit=1)
-        if len(matches) == 0:
-            return None
-        else:
-            return matches[0]
+        return self._doors.get(door_id, None)
 
     def uncollide(self, entity):
         initial_rect = entity.get_rect()
@@ -459,8 +1139,7 @@ class World:
     def is_touching(self, actor, category, direction, cond=None, dist=1):
         rect = actor.get_rect()
         detector_rect = cool_math.sliver_adjacent(rect, direction, thickness=dist)
-        detected = self.get_entities_in_rect(detector_rect, category=category, cond=cond, limit=1)
-        return len(detected) > 0
+        return self.any_in_rect(detector_rect, category=category, cond=cond)
 
     def to_world_pos(self, screen_x, screen_y):
         x = screen_x + self.camera[0]